@@ -10,13 +10,35 @@
 # -------------------------------------------------------------------------------
 # coding=utf-8
 from __future__ import print_function
-from par import *
-from config import *
-from interface import *
-from copy import deepcopy
+import math
 import os
+import sys
+from pyprog import SynthError, Writer, Signal, Lit, Var, Num, Bool, Opc, Op, Assign, Return, Body, Block, IfElse, Function, PyProg
+from astpar import AstPar
+from dfg import Graph, expr_vars
+from prof import NoProfiler
+from passes import PassManager
+from config import Conf
+from interface import Interface
+from cache import read_text
+from verilog import write_verilog
+import timing
+import csd
 
 pipe_debug = False
+profile = False     # save per-phase time, memory and IR size to proc_profile.json
+cache_dir = ".pipecache"    # output cache directory in output directory (None: no cache)
+template_file = os.path.join(os.path.dirname(os.path.abspath(__file__)), "work", "sigproc.tmp")
+outputs = ["proc.py", "proc.v", "red_pitaya_proc.v"]     # artifact names (output files)
+# pipe_transform passes, required analyses are run by the pass manager (Transf.passes)
+transform_passes = ["conditions_assign",    # convert if-else to conditional assignments
+                    "fold_constants",       # constant folding and strength reduction
+                    "constant_multipliers", # multiplications by constants to shift-add networks
+                    "pipeline_variables",   # transform dataflow assignments to pipeline
+                    "decompbody",           # expand assignments to binary expressions
+                    "evaluatebody",         # target sizes (value ranges) and dataflow levels
+                    "required_widths",      # MSBs not needed by outputs and conditions removed
+                    "conditions_body"]      # convert conditional assignments back to if statements
 
 
 def is_stream_var(name):    # return True if variable name defines pipeline stream
@@ -28,32 +50,76 @@ def is_stream_var(name):    # return True if variable name defines pipeline stre
 
 class Transf:
 
-    def __init__(self, prg, conf):
-        self.prg = prg
+    def __init__(self, prg, conf, prof=None, log=None):
+        self.prg = prg.clone()  # transform a copy, parsed program prg is not changed
         self.conf = conf
+        self.prof = prof or NoProfiler()    # phase profiler (prof.Profiler)
+        self.log = log      # file-like for messages (None: stdout)
+        self.done = ""      # last finished phase: analyze, transform, wrapper (checkpoint.phases)
         self.fn = Block("")
 
         self.assignments = []
         self.conditions = []
 
-        self.targets = []   # list of assignment targets
+        self.targets = set()    # set of assignment targets
         self.return_varlist = []
-        self.varlist = []   # list of expression variables
-        self.varlist_is_reg = False
 
         self.vardict = {}
         self.stlist = []    # list of statements (get_statement)
         self.stpos = []     # position of statements in body (get_statement)
 
         self.new_stlist = []
-        self.new_vardict = {}  # last translation of source name to register var name
+        self.graph = None   # SSA dataflow graph of function assignments (pipeline_variables)
+        self.pipe_levels = 0
+        self.period = None  # target clock period (ns) for timing-driven pipeline, None: register every value
+        if conf.clock:
+            self.period = 1000.0 / conf.clock
+        self.delay = 0.0    # estimated critical path delay of a stage (ns)
+        self.device = timing.device(conf.device)    # operator delay and area model
+        self.dsp = {}       # operator -> role in DSP slice: pre, mul, post (map_dsp)
+        self.dsp_groups = []    # DSP multiply-add groups of assignments (pre-adder, multiply, post-adder)
+        self.dsp_report = []    # DSP groups with internal register settings (report_dsp)
+        self.dsp_blocks = {}    # clocked block name of DSP group -> report line (build_wrapper)
+        self.dsp_saved = 0  # DSP slices of multiplications by constants replaced by shift-add networks
+        self.paths = []     # static timing paths of stages and comb blocks (static_timing)
+        self.resources = (0, 0, 0)  # estimated LUT, FF, DSP
 
         self.vt = {}
+        self.ranges = {}    # variable -> value interval (lo, hi) of its assignments (evaluatebody)
+        self.myp = None     # MyHDL wrapper program and port list (build_wrapper)
+        self.vlist = ""
         self.naddsub = 0
         self.nmul = 0
-
-        self.reg_namelist = []  # list of register names (before renaming, a, b, x)
-        self.reg_varlist = []   # list of register vars based on assignments
+        self.pm = self.passes()
+
+    def passes(self):  # pass manager with transformation passes and analyses (provides) they depend on
+        pm = PassManager(self.prof, lambda: self.fn)
+        pm.add("get_function", self.get_function, provides=("function",))
+        pm.add("analyze_body", lambda: self.analyze_body(self.fn.body, False), ("function",), ("widths",))
+        pm.add("conditions_assign", lambda: self.conditions_assign(self.fn.body, 0), ("function",),
+               ("conditions",), ("defuse",))
+        pm.add("defuse", self.defuse, ("conditions",), ("defuse",))
+        pm.add("fold_constants", self.fold_constants, ("widths", "defuse"))
+        pm.add("constant_multipliers", self.constant_multipliers, ("widths", "defuse"))
+        pm.add("pipeline_variables", self.pipeline_variables, ("widths", "defuse"), ("pipeline",), ("defuse",))
+        pm.add("decompbody", self.decompose, ("pipeline",), ("binary",), ("levels",))
+        pm.add("evaluatebody", self.evaluate, ("binary",), ("levels",))
+        pm.add("required_widths", self.required_widths, ("levels",))
+        pm.add("conditions_body", self.conditions_body, ("conditions", "levels"), ("ifs",), ("conditions",))
+        pm.add("build_wrapper", self.build_wrapper, ("ifs",), ("wrapper",), ("function", "ifs"))
+        pm.add("static_timing", self.static_timing, ("wrapper",), ("timing",))
+        return pm
+
+    def __getstate__(self):  # checkpoint state: without profiler, log, pass manager and dataflow graph
+        d = self.__dict__.copy()
+        d.update({"prof": None, "log": None, "graph": None, "pm": sorted(self.pm.valid)})
+        return d
+
+    def __setstate__(self, d):
+        self.__dict__.update(d)
+        self.prof = NoProfiler()
+        self.pm = self.passes()
+        self.pm.valid.update(d["pm"])
 
 # Useful functions
 
@@ -65,27 +131,24 @@ class Transf:
 
     def report(self):
         # print ("Levels: "+str(self.nlevels))
-        print ("Resources:")
-        print ("ADD/SUB: "+str(self.naddsub))
-        print ("MUL: "+str(self.nmul))
-        print ("Dataflow levels:")
+        print ("Resources:", file=self.log)
+        print ("ADD/SUB: "+str(self.naddsub), file=self.log)
+        print ("MUL: "+str(self.nmul), file=self.log)
+        print ("Dataflow levels:", file=self.log)
         for key in self.vt:
-            print (" "+str(key)+": "+str(self.vt[key]))
+            print (" "+str(key)+": "+str(self.vt[key]), file=self.log)
 
-    def get_function(self):  # return Function block of the program (or error exit)
+    def get_function(self):  # return Function block of the program (or SynthError)
         if len(self.prg.body.stlist) == 0:
-            print ("Get function: empty program")
-            exit(0)
+            raise SynthError("Get function: empty program")
         if not isinstance(self.prg.body.stlist[0], Function):
-            print ("Get function: expecting function")
-            exit(0)
+            raise SynthError("Get function: expecting function")
         self.fn = self.prg.body.stlist[0]
 
         # check if Return statement is last
         self.get_statements(self.fn)
         if len(self.stlist) < 1:
-            print ("Get function: Function body is empty!")
-            exit(0)
+            raise SynthError("Get function: Function body is empty!")
 
         r = self.stlist[-1]
         if isinstance(r, Return):
@@ -94,12 +157,11 @@ class Transf:
                     i = self.conf.outputs.index(v.name)
                     v.setsize(self.conf.outsize[i])
                 else:
-                    print ("Warning: output '"+v.name+"' is not in configuration! Set size: 16")
+                    print ("Warning: output '"+v.name+"' is not in configuration! Set size: 16", file=self.log)
                     v.setsize(16)
             self.return_varlist = r.varlist
         else:
-            print ("Get function: Expecting return!")
-            exit(0)
+            raise SynthError("Get function: Expecting return!")
 
         for v in self.fn.vardict.values():
             if v.mode == Signal.inport:
@@ -107,7 +169,7 @@ class Transf:
                     i = self.conf.inputs.index(v.name)
                     v.setsize(self.conf.insize[i])
                 else:
-                    print ("Warning: input '"+v.name+"' is not in configuration! Set size: 16")
+                    print ("Warning: input '"+v.name+"' is not in configuration! Set size: 16", file=self.log)
                     v.setsize(16)
 
     def get_statements(self, block, stype=None):  # get list of statements of stype
@@ -181,195 +243,135 @@ class Transf:
                     del self.fn.body.stlist[i-1]
                     self.assignments = []
 
-    def get_variables(self, op, start=True):   # get list of variables from expression
-        if start:   # clear the var list the first time it is called
-            self.varlist = []
-            self.varlist_is_reg = False
-        if isinstance(op.left, Var):
-            if op.left not in self.varlist:
-                self.varlist.append(op.left)
-                if op.left.name in self.reg_namelist:
-                    # print ("Found reg")
-                    self.varlist_is_reg = True
-        elif isinstance(op.left, Op):
-            self.get_variables(op.left, False)
-        if isinstance(op.right, Var):
-            if op.right not in self.varlist:
-                self.varlist.append(op.right)
-                if op.right.name in self.reg_namelist:
-                    # print ("Found reg")
-                    self.varlist_is_reg = True
-        elif isinstance(op.right, Op):
-            self.get_variables(op.right, False)
-
-    def set_variables(self, op, level, start=True):   # set variables to level
-        if start:   # clear the var list the first time it is called
-            pass
-        if isinstance(op.left, Var):
-            if op.left.name in self.reg_namelist:
-                v = self.fn.get_var(op.left.name+"_z"+str(level))  # get or create new register
-                v.register = True
-                v.reglevel = level
-                if v not in self.reg_varlist:
-                    self.reg_varlist.append(v)
-                op.left = v
-                # print ("Replace reg "+v.name)
-
-        elif isinstance(op.left, Op):
-            self.set_variables(op.left, level, False)
-        if isinstance(op.right, Var):
-            if op.right.name in self.reg_namelist:
-                v = self.fn.get_var(op.right.name+"_z"+str(level))
-                v.register = True
-                v.reglevel = level
-                if v not in self.reg_varlist:
-                    self.reg_varlist.append(v)
-                op.right = v
-                # print ("Replace reg "+v.name)
-        elif isinstance(op.right, Op):
-            self.set_variables(op.right, level, False)
+    def add_pipe_statement(self, a, levels):  # append assignment to function body, stlist and level index
+        self.fn.body.add(a)
+        self.stlist.append(a)
+        levels.setdefault(a.target.reglevel, []).append(a)
+
+    def set_registers(self, op, regs):  # replace stream variables in expression with registers {var: reg}
+        if isinstance(op.left, Op):
+            self.set_registers(op.left, regs)
+        elif op.left in regs:
+            op.left = regs[op.left]
+        if isinstance(op.right, Op):
+            self.set_registers(op.right, regs)
+        elif op.right in regs:
+            op.right = regs[op.right]
 
 
 ################################################################################################
 ##### Analysis
 ################################################################################################
 
-    def decompose(self, b):  # decompose assignment block into binary assignments
-        change = False
-        imax = len(b.body.stlist)
-        for i in range(imax):     # loop through assignments
-            st = b.body.stlist[i]
-            if not isinstance(st, Assign):
-                print ("Decompose: Expected assignment: "+st.code())
-                exit(-1)
-
-            target_name = st.target.name
-
-            if len(st.oplist) != 1:  # make sure oplist is in binary tree form
-                print ("Decompose: error in oplist, length = "+str(len(st.oplist)))
-                exit(-1)
-
-            op = st.oplist[0]
-
-            if isinstance(op.left, Op):   # Expand left operand
-                change = True
-                nv = Var(target_name+"1")  # create new variable, left name suffix: 1
-                b.add_var(nv)             # add to block and
-                a = Assign(nv)            # to new assignment
-                a.addop(op.left)
-                op.left = nv              # replace op.left with variable
-                b.body.insert(0, a)       # and insert to block
-
-            if isinstance(op.right, Op):  # Expand right operand
-                change = True
-                nv = Var(target_name+"2")  # create new variable, right name suffix: 2
-                b.add_var(nv)
-                a = Assign(nv)
-                a.addop(op.right)
-                op.right = nv
-                b.body.insert(0, a)
-        return change
-
-    def evaluate(self, b):  # evaluate  expressions in assignment block
-        imax = len(b.body.stlist)
-        for i in range(imax):
-            st = b.body.stlist[i]
-            if isinstance(st, Assign):  # evaluate all Assign statement
-                if st.target.mode == Signal.no:  # mark undefined variable as Signal.int
-                    st.target.mode = Signal.int
-
-                jmax = len(st.oplist)
-                for j in range(jmax):  # loop through operators
-                    op = st.oplist[j]
-
-                    if isinstance(op.left, Lit):
-                        left = op.left
-                        ls = left.size
-                        ll = left.tree_level
-                        if ll < 0 and not isinstance(op.left, Num):
-                            print ("EvaluateBody: variable "+left.name+" undefined in")
-                            print (st.code(0))
-                            return False
-                        if isinstance(op.right, Lit):
-                            right = op.right
-                            rs = right.size
-                            rl = right.tree_level
-                            if rl < 0 and not isinstance(op.right, Num):
-                                print ("EvaluateBody: variable "+right.name+" undefined in")
-                                print (st.code(0))
-                                return False
-                            if op.op == '>>':
-                                rs = right.value
-                                if isinstance(op.right, Num):
-                                    print ("SHR: "+str(right.value))
-                                else:
-                                    print ("EvaluateBody: only support shift by constant!")
-                                    print (st.code(0))
-                                    return False
-                        else:  # OPT: propagation!!
-                            rs = 0
-                            rl = 0
-                    else:
-                        print ("EvaluateBody: expecting left Literal!")
-
-                    if rl > ll:  # define result level
-                        yl = rl + 1
-                    else:
-                        yl = ll + 1
-
-                    st.target.tree_level = yl
-                    self.var_tree(st.target.name, yl)
+    def op_size(self, op, ls, rs):  # size of operation result from operand sizes (rs: shift for >>, <<)
+        if op.opc == Opc.add or op.opc == Opc.sub:
+            if ls > rs:
+                return ls + 1
+            return rs + 1
+        elif op.opc == Opc.mul:
+            return ls + rs
+        elif op.opc == Opc.shr:
+            return ls - rs
+        elif op.opc == Opc.shl:
+            return ls + rs
+        elif op.opc == Opc.load:
+            if ls >= rs:
+                return ls
+            return rs
+        return 0  # unknown op
+
+    def op_range(self, op, lr, rr):  # value interval of operation result from operand intervals, None: unknown
+        (l1, h1) = lr
+        (l2, h2) = rr
+        if op.opc == Opc.add:
+            return l1 + l2, h1 + h2
+        elif op.opc == Opc.sub:
+            return l1 - h2, h1 - l2
+        elif op.opc == Opc.mul:
+            p = [l1*l2, l1*h2, h1*l2, h1*h2]
+            return min(p), max(p)
+        elif op.opc == Opc.shr:     # shift by constant
+            return l1 >> l2, h1 >> l2
+        elif op.opc == Opc.shl:
+            return l1 << l2, h1 << l2
+        elif op.opc == Opc.load:
+            return lr
+        return None
+
+    def range_bits(self, r):  # signed bits of value interval
+        n = 1
+        for v in r:
+            if v < 0:
+                v = -v - 1
+            n = max(n, v.bit_length() + 1)
+        return n
+
+    def var_range(self, x):  # value interval of operand: constant, assigned values or variable size
+        if isinstance(x, Num) or isinstance(x, Bool):
+            return x.value, x.value
+        r = self.ranges.get(x)
+        if r is None or self.range_bits(r) > max(x.size, 1):   # no assignment, inputs or wrapped to size
+            if x.size <= 1:
+                return 0, 1
+            return -2**(x.size-1), 2**(x.size-1) - 1
+        return r
+
+    def evaluate_op(self, op, st):  # evaluate expression tree, annotate op size, level; return False on error
+        operands = []
+        for x in [op.left, op.right]:
+            if isinstance(x, Op):
+                if not self.evaluate_op(x, st):
+                    return False
+            elif x is None:
+                x = Lit("")
+                x.tree_level = 0
+            elif x.tree_level < 0 and not isinstance(x, Num):
+                print ("EvaluateBody: variable "+x.name+" undefined in", file=self.log)
+                print (st.code(0), file=self.log)
+                return False
+            operands.append(x)
+        left, right = operands
+
+        if op.opc == Opc.shr or op.opc == Opc.shl:
+            if isinstance(right, Num):
+                print (("SHR: " if op.opc == Opc.shr else "SHL: ")+str(right.value), file=self.log)
+            else:
+                print ("EvaluateBody: only support shift by constant!", file=self.log)
+                print (st.code(0), file=self.log)
+                return False
+            rs = right.value
+        else:
+            rs = right.size
 
-                    if op.op == '+' or op.op == '-':
-                        self.naddsub += 1
-                        if ls > rs:
-                            es = ls + 1
-                        else:
-                            es = rs + 1
-                    elif op.op == '*':
-                        self.nmul += 1
-                        es = ls + rs
-                    elif op.op == '>>':
-                        es = ls - rs
-
-                    elif op.op == 'load' or op.op == '':
-                        if ls >= rs:
-                            es = ls
-                        else:
-                            es = rs
-                    else:
-                        es = 0  # unknown op
+        op.tree_level = max(left.tree_level, right.tree_level) + 1
+        op.size = self.op_size(op, left.size, rs)
 
-                    if st.target.mode == Signal.outport:
-                        if st.target.size != es:
-                            print ("Warning: output '"+st.target.name+"' resized from "+str(es)+" to "+str(st.target.size))
-                    else:
-                        st.target.setsize(es)  # set size of target var
-                    # print ("Size: "+str(es)+":"+op.left.name+"="+str(ls)+","+op.right.name+"="+str(rs))
+        if op.opc == Opc.add or op.opc == Opc.sub:  # resources are counted once, here
+            self.naddsub += 1
+        elif op.opc == Opc.mul:
+            self.nmul += 1
         return True
 
     def analyze_body(self, cbody, cond):    # analyze body, cond=True for conditional (if, else) body
         for st in cbody.stlist:
             if isinstance(st, Assign):
-                print ("ST: "+st.code(0), end="")
+                print ("ST: "+st.code(0), end="", file=self.log)
                 if (not cond) and (st.target in self.targets):
-                    print ("Analyse error: Multiple unconditional assignments not supported.")
-                    exit(0)
-                self.targets.append(st.target)
+                    raise SynthError("Analyse error: Multiple unconditional assignments not supported.")
+                self.targets.add(st.target)
 
-                b = Block("decomp")  # create tmp block
-                cp_st = deepcopy(st)
-                cp_st.target = st.target
-                b.add_to_body(cp_st)  # add copy of st to body
-                b.vardict = deepcopy(self.fn.vardict)
-
-                i = 1
-                while self.decompose(b):  # iteratively break expressions to binary in block b
-                    i += 1
-                # print ("Decompose "+str(i)+"-times.")
+                if st.target.mode == Signal.no:  # mark undefined variable as Signal.int
+                    st.target.mode = Signal.int
 
-                self.evaluate(b)    # evaluate expression (data size)
-                print ("  "+st.target.emit())
+                op = st.oplist[0]
+                if self.evaluate_op(op, st):  # evaluate expression tree (data size) in place
+                    st.target.tree_level = op.tree_level
+                    if st.target.mode == Signal.outport:
+                        if st.target.size != op.size:
+                            print ("Warning: output '"+st.target.name+"' resized from "+str(op.size)+" to "+str(st.target.size), file=self.log)
+                    else:
+                        st.target.setsize(op.size)  # set size of target var
+                print ("  "+st.target.emit(), file=self.log)
 
             elif isinstance(st, IfElse):  # za IfElse naredi rekurzivno za oba dela
 
@@ -378,181 +380,652 @@ class Transf:
                     self.analyze_body(st.elsbody, True)
 
     def analyze(self):
-        print ("-------- Analyse input function: --------")
-        self.get_function()     # get input function
-        self.analyze_body(self.fn.body, False)  # recursively analyze function body
+        print ("-------- Analyse input function: --------", file=self.log)
+        self.pm.run("analyze_body")  # get input function, recursively analyze function body
 
         # print (p.emit())
         # print (p.code())
-        print ("-----------------------------------------")
+        print ("-----------------------------------------", file=self.log)
+        self.done = "analyze"
 
 ################################################################################################
 
-    def pipeline_variables(self):   # transform statements to pipeline, mark registers
+    def defuse(self):  # dataflow graph of function assignments (self.stlist)
+        self.get_statements(self.fn, Assign)   # Loop through Assignment statements
+        self.graph = Graph(self.fn, self.stlist)
+        return self.graph
+
+    def fold_op(self, op, count):  # fold constants, reduce strength of expression tree, return new tree (Op or Lit)
+        if isinstance(op.left, Op):
+            op.left = self.fold_op(op.left, count)
+        if isinstance(op.right, Op):
+            op.right = self.fold_op(op.right, count)
+        if op.opc == Opc.load or op.opc == Opc.signal:
+            return self.size_op(op)
+        (l, r) = (op.left, op.right)
+        v = op.eval()
+        if v is not None:   # constant expression
+            count[0] += 1
+            if op.opc in (Opc.add, Opc.sub, Opc.mul, Opc.shr, Opc.shl):
+                return Num(str(v))
+            return Bool(str(bool(v)))
+        lv = rv = None      # constant operands
+        if isinstance(l, Num):
+            lv = l.value
+        if isinstance(r, Num):
+            rv = r.value
+        x = None
+        if op.opc == Opc.add or op.opc == Opc.sub:
+            if rv == 0:                                 # x + 0, x - 0
+                x = l
+            elif lv == 0 and op.opc == Opc.add:         # 0 + x
+                x = r
+            elif rv is not None and isinstance(l, Op) and l.opc in (Opc.add, Opc.sub) and isinstance(l.right, Num):
+                c = l.right.value * (1 if l.opc == Opc.add else -1) + rv * (1 if op.opc == Opc.add else -1)
+                x = l.left                              # (x +- c1) +- c2 = x + c
+                if c > 0:
+                    x = Op(x, "+", Num(str(c)))
+                elif c < 0:
+                    x = Op(x, "-", Num(str(-c)))
+        elif op.opc == Opc.mul:
+            if lv is not None:      # constant on the right
+                (l, r, lv, rv) = (r, l, rv, lv)
+            if rv == 0:                                 # x * 0
+                x = Num("0")
+            elif rv == 1:                               # x * 1
+                x = l
+            elif rv is not None and rv > 0 and rv & (rv - 1) == 0:  # x * 2^k = x << k
+                x = Op(l, "<<", Num(str(rv.bit_length() - 1)))
+            elif rv is not None and isinstance(l, Op) and l.opc == Opc.mul and isinstance(l.right, Num):
+                x = Op(l.left, "*", Num(str(l.right.value * rv)))  # (x * c1) * c2
+        elif op.opc == Opc.shr or op.opc == Opc.shl:
+            if rv == 0:                                 # x >> 0, x << 0
+                x = l
+            elif rv is not None and isinstance(l, Op) and isinstance(l.right, Num) and l.opc == op.opc:
+                x = Op(l.left, op.op, Num(str(l.right.value + rv)))    # x >> a >> b, x << a << b
+            elif rv is not None and isinstance(l, Op) and isinstance(l.right, Num) and l.opc == Opc.shl:
+                k = l.right.value - rv                  # x << a >> b = x << (a-b) or x >> (b-a), exact
+                x = l.left
+                if k > 0:
+                    x = Op(x, "<<", Num(str(k)))
+                elif k < 0:
+                    x = Op(x, ">>", Num(str(-k)))
+        if x is None:
+            return self.size_op(op)
+        count[0] += 1
+        if isinstance(x, Op):
+            return self.fold_op(x, count)   # rewrite may enable another one
+        return x
+
+    def count_ops(self, op, opcs):  # number of operators of opcs in expression tree
+        n = int(op.opc in opcs)
+        for x in [op.left, op.right]:
+            if isinstance(x, Op):
+                n += self.count_ops(x, opcs)
+        return n
+
+    def fold_constants(self):  # constant folding and strength reduction before pipelining, return number of rewrites
         """
-Do assignment statements transformation from sequential to pipeline.
-- check if assignment expression contains pipeline variables (registers) and define reglevel
-- rename assignment target and register variables to indicate level, mark variables as registers
-- add missing registers from end level (pipe_levels) to level 0
-- reorder assignments according to the level
+Evaluate constant subexpressions (Op.eval) and simplify assignment expressions:
+x + 0, x - 0, x * 1, x * 0, x >> 0, x << 0; x * 2^k to x << k; (x +- c1) +- c2,
+(x * c1) * c2 and shift chains to one operator with constant.
+An internal variable with one unconditional constant assignment (not used in
+conditions) is replaced by the constant, its assignment removed: fewer stages
+and registers in pipeline_variables.
         """
-        for w in self.fn.vardict.values():  # browse block variables, fill reg_namelist for stream members (eg. a, b)
-            if is_stream_var(w.name):
-                self.reg_namelist.append(w.name)
+        g = self.pm.get("defuse")
+        cvars = set()   # variables of conditions
+        for st in self.stlist:
+            for (cond, b) in st.clist:
+                cvars.update(expr_vars(cond.oplist[0], []))
+        consts = {}     # constant variable -> Num
+        count = [0]
+        nadd = nmul = 0
+        stlist = []
+        for st in self.fn.body.stlist:
+            if not isinstance(st, Assign):
+                stlist.append(st)
+                continue
+            op = st.oplist[0]
+            nadd += self.count_ops(op, (Opc.add, Opc.sub))
+            nmul += self.count_ops(op, (Opc.mul,))
+            if consts and [v for v in expr_vars(op, []) if v in consts]:
+                self.set_registers(op, consts)  # replace constant variables
+                count[0] += 1
+            op = self.fold_op(op, count)
+            if not isinstance(op, Op):
+                op = self.size_op(Op(op, "load", None))
+            st.oplist[0] = op
+            nadd -= self.count_ops(op, (Opc.add, Opc.sub))
+            nmul -= self.count_ops(op, (Opc.mul,))
+            v = st.target
+            if (isinstance(op.left, Num) and op.opc == Opc.load and not st.clist and v.mode == Signal.int
+                    and v not in cvars and len(g.defnode[st].defs) == 1):
+                consts[v] = op.left     # constant variable, assignment removed
+                del self.fn.vardict[v.name]
+                continue
+            stlist.append(st)
+        self.fn.body.stlist = stlist
+        self.naddsub -= nadd
+        self.nmul -= nmul
+        if count[0]:
+            self.pm.invalidate("defuse")
+        print ("Fold: %d rewrites, %d constant variables, %d add/sub and %d mul removed" % (
+            count[0], len(consts), nadd, nmul), file=self.log)
+        return count[0]
+
+    def constant_muls(self, st, op, parent, side, g, depth, groups):  # collect multiplications by constants, True if found
+        found = False
+        if isinstance(op.left, Op):
+            found = self.constant_muls(st, op.left, op, "left", g, depth, groups)
+        if isinstance(op.right, Op):
+            found = self.constant_muls(st, op.right, op, "right", g, depth, groups) or found
+        if op.opc != Opc.mul:
+            return found
+        if isinstance(op.right, Num) and isinstance(op.left, (Var, Op)):
+            x, c = op.left, op.right.value
+        elif isinstance(op.left, Num) and isinstance(op.right, (Var, Op)):
+            x, c = op.right, op.left.value
+        else:
+            return found
+        if c <= 0 or (isinstance(x, Op) and found):  # negative constant, operand with constant multiplication
+            return found
+        key = op    # operand value (dataflow graph node) and depth of assignment, or expression
+        if isinstance(x, Var):
+            key = ([n for n in g.operands[st] if n.var.name == x.name][0], depth[g.defnode[st]])
+        if key not in groups:
+            groups[key] = []
+        groups[key].append((st, parent, side, op, x, c))
+        return True
 
+    def size_op(self, op):  # annotate operator size from operand sizes, return op
+        if op.right is None:    # load
+            op.size = op.left.size
+        elif op.left is not None:
+            rs = op.right.size
+            if op.opc == Opc.shr or op.opc == Opc.shl:
+                rs = op.right.value
+            op.size = self.op_size(op, op.left.size, rs)
+        return op
+
+    def shift_add_op(self, left, o, right, adders):  # operator of shift-add network with size, append adders
+        op = self.size_op(Op(left, o, right))
+        if op.opc != Opc.shl:
+            adders.append(op)
+        return op
+
+    def shift_add(self, parts, bases, adders):  # expression of sum of parts [(sign, shift, base)] > 0, balanced tree
+        xs = []
+        for (s, k, b) in sorted(parts, key=lambda p: (-p[0], p[1], p[2])):    # positive parts first
+            x = bases[b]
+            if k > 0:
+                x = self.shift_add_op(x, "<<", Num(str(k)), adders)
+            xs.append((s, x))
+        while len(xs) > 1:
+            ys = []
+            for i in range(0, len(xs)-1, 2):
+                (s1, x1), (s2, x2) = xs[i], xs[i+1]
+                if s1 == s2:    # sign of both parts stays for next level
+                    ys.append((s1, self.shift_add_op(x1, "+", x2, adders)))
+                elif s1 > 0:
+                    ys.append((1, self.shift_add_op(x1, "-", x2, adders)))
+                else:
+                    ys.append((1, self.shift_add_op(x2, "-", x1, adders)))
+            if len(xs) % 2:
+                ys.append(xs[-1])
+            xs = ys
+        return xs[0][1]
+
+    def chain(self, e, vs, chains):  # (assignments, delay) of shift-add expression e with operands vs, chains of new variables
+        n, t = 0, 0.0
+        for v in vs:
+            if v in chains:
+                n, t = max(n, chains[v][0]), max(t, chains[v][1])
+        if isinstance(e, Op):
+            t += self.device.expr_delay(e)
+        return n, t
+
+    def op_dsps(self, op):  # DSP slices of multiplications in expression tree
+        n = 0
+        if op.opc == Opc.mul:
+            n = self.device.cost(op)[2]
+        for x in [op.left, op.right]:
+            if isinstance(x, Op):
+                n += self.op_dsps(x)
+        return n
+
+    def new_var(self, name, names):  # new (not yet added) internal variable with name not in function or names
+        while name in self.fn.vardict or name in names:
+            name += "_"
+        names.add(name)
+        v = Var(name)
+        v.mode = Signal.int
+        return v
+
+    def constant_multipliers(self):  # multiplications by constants to shift-add networks, return DSP slices saved
+        """
+Rewrite multiplications by positive constants to CSD shift-add networks (csd.py):
+- constants multiplying the same operand value (or expression) in assignments of the same
+  dataflow depth (pipeline stage) are a group, CSD digit pairs in common to its multiplications
+  are computed once as shared terms (new assignments before the first multiplication of the
+  group), products used more than once too; terms for later stages would need delay registers
+- a group is rewritten when the LUTs of its adders and of the registers of added pipeline
+  stages are less than the area of its multipliers; a DSP slice is weighted by the device
+  LUT/DSP ratio (timing.Device.dsp_luts) times the DSP pressure (slices needed by the
+  multiplications / slices of the device), which drops as groups are rewritten
+- added stages: new assignments of terms and products (a stage each without target clock),
+  with target clock the stages of the adder tree delay more than those of the multiplier;
+  an add of the product is a free DSP post-adder (map_dsp) but LUTs after rewriting
+- multiplications by powers of 2 are shifts (no adders)
+        """
+        if not self.conf.csd:
+            return 0
+        g = self.pm.get("defuse")
+        groups = {}     # operand value or expression -> [(statement, parent op, side, multiply, operand, constant)]
+        depth = {}      # value -> dataflow depth from inputs
+        for st in self.stlist:
+            n = g.defnode[st]
+            depth[n] = max([depth.get(n, 0)] + [depth.get(n1, 0) + 1 for n1 in g.operands[st]])
+            self.constant_muls(st, st.oplist[0], None, None, g, depth, groups)
+        need = sum([self.op_dsps(st.oplist[0]) for st in self.stlist])  # DSP slices of multiplications
+        pos = dict([(st, i) for (i, st) in enumerate(self.fn.body.stlist)])
+        inserts = {}    # statement -> new assignments before it
+        names = set()
+        nmul = nadd = 0
+        for key in sorted(groups, key=lambda k: pos[groups[k][0][0]]):
+            uses = groups[key]
+            x = uses[0][4]
+            consts = sorted(set([csd.odd(c)[0] for (st, parent, side, op, x1, c) in uses]) - set([1]))
+            if len(uses) > 1:   # shared terms
+                (terms, reps) = csd.mcm(consts)
+            else:               # terms in one expression are not shared
+                (terms, reps) = ([], dict([(c, [(s, k, 0) for (s, k) in csd.csd(c)]) for c in consts]))
+            count = {}
+            for (st, parent, side, op, x1, c) in uses:
+                count[csd.odd(c)[0]] = count.get(csd.odd(c)[0], 0) + 1
+            new = []        # new assignments of group: operand, terms, products
+            chains = {}     # new variable -> (assignments, delay) of its chain from the operand
+            adders = []
+            bases = [x]
+            name = "(" + x.code().strip() + ")"
+            if isinstance(x, Var):
+                name = x.name
+            elif consts:    # expression operand used more than once: assign to new variable
+                v = self.new_var(uses[0][0].target.name + "_x", names)
+                v.setsize(x.size)
+                new.append((v, x))
+                chains[v] = (1, self.device.expr_delay(x))
+                bases[0] = v
+            for (value, parts) in terms[1:]:
+                e = self.shift_add(parts, bases, adders)
+                v = self.new_var(bases[0].name + "_" + str(value) + "x", names)
+                v.setsize(e.size)
+                new.append((v, e))
+                (n, t) = self.chain(e, [bases[b] for (s, k, b) in parts], chains)
+                chains[v] = (n + 1, t)
+                bases.append(v)
+            products = {1: bases[0]}
+            for c in consts:
+                if count[c] > 1 and len(reps[c]) > 1:   # shared product
+                    e = self.shift_add(reps[c], bases, adders)
+                    v = self.new_var(bases[0].name + "_" + str(c) + "x", names)
+                    v.setsize(e.size)
+                    new.append((v, e))
+                    (n, t) = self.chain(e, [bases[b] for (s, k, b) in reps[c]], chains)
+                    chains[v] = (n + 1, t)
+                    products[c] = v
+            repl = []
+            cost = 0.0      # LUT area of multipliers
+            dsps = 0
+            stages = 0      # pipeline stages added by the shift-add network
+            bits = 0        # register bits of a stage: products
+            post = 0        # LUTs of adds of products mapped to DSP post-adders (map_dsp)
+            for (st, parent, side, op, x1, c) in uses:
+                (o, k) = csd.odd(c)
+                e = products.get(o)
+                if e is None:
+                    e = self.shift_add(reps[o], bases, adders)
+                    (n, t) = self.chain(e, [bases[b] for (s, k1, b) in reps[o]], chains)
+                else:
+                    (n, t) = self.chain(e, [e], chains)
+                if k > 0:
+                    e = self.shift_add_op(e, "<<", Num(str(k)), adders)
+                if self.period:     # stages of adder tree delay more than of multiplier delay
+                    pe = self.period - self.device.register
+                    n = int(math.ceil(t / pe)) - int(math.ceil(self.device.expr_delay(op) / pe))
+                stages = max(stages, n)
+                bits += op.size
+                if self.period and self.conf.dsp and parent is not None and parent.opc in (Opc.add, Opc.sub):
+                    post += self.device.cost(parent)[1]     # add of product: free post-adder of DSP slice
+                (d, l, n) = self.device.cost(op)
+                cost += l + n * self.device.dsp_luts() * need / self.device.resources[2]
+                dsps += n
+                repl.append((st, parent, side, e))
+            luts = sum([self.device.cost(op)[1] for op in adders])
+            luts += stages * bits * self.device.ff_luts() + post
+            print ("CSD: %s * %s: %d adders, %d stages, %d LUT (multipliers: %d DSP of %d needed, %d LUT) -> %s" % (
+                name, ", ".join([str(c) for (st, parent, side, op, x1, c) in uses]), len(adders), stages, luts,
+                dsps, need, cost, "shift-add" if luts < cost else "multiply"), file=self.log)
+            if luts >= cost:
+                continue
+            for (st, parent, side, e) in repl:  # rewrite group
+                if parent is None:
+                    if not isinstance(e, Op):
+                        e = Op(e, "load", None)
+                        e.size = e.left.size
+                    st.oplist[0] = e
+                else:
+                    setattr(parent, side, e)
+            first = min([st for (st, parent, side, op, x1, c) in uses], key=lambda st: pos[st])
+            for (v, e) in new:
+                self.fn.add_var(v)
+                a = Assign(v)
+                a.addop(e)
+                inserts.setdefault(first, []).append(a)
+            nmul += len(uses)
+            nadd += len(adders)
+            need -= dsps
+            self.dsp_saved += dsps
+
+        if nmul:
+            stlist = []
+            for st in self.fn.body.stlist:
+                stlist.extend(inserts.get(st, []))
+                stlist.append(st)
+            self.fn.body.stlist = stlist
+            self.nmul -= nmul
+            self.naddsub += nadd
+            self.pm.invalidate("defuse")
+        print ("CSD: %d multiplications by constants to %d adders, DSP saved: %d" % (
+            nmul, nadd, self.dsp_saved), file=self.log)
+        return self.dsp_saved
+
+    def map_dsp(self, g):  # map multiply-add patterns of binary assignments to DSP slices, return number of groups
+        """
+Match pre-adder -> multiply -> post-adder patterns of stream values on the dataflow graph:
+- multiply fitting one DSP slice (device.dsp operand sizes)
+- pre-adder: add/sub defining a multiply operand used only by the multiply, result fits port A
+- post-adder: add/sub of the product used only there, other operand is port C or the
+  cascaded output of another group (accumulation)
+Mapped operators are marked in self.dsp for delays and costs, schedule() registers the
+group inputs (AREG, BREG), ADREG, MREG and PREG where the clock period needs them,
+build_wrapper() emits the registers of each group as its own clocked block (dsp<i>).
+        """
+        (pa, pb) = self.device.dsp
+        stream = set([n for n in g.nodes if not n.defs and is_stream_var(n.var.name)])
+        for st in self.stlist:
+            if [n for n in g.operands[st] if n in stream]:
+                stream.add(g.defnode[st])
+            op = st.oplist[0]
+            m = g.defnode[st]
+            if op.opc != Opc.mul or m not in stream or len(m.defs) != 1:  # no conditional value (mux register)
+                continue
+            if self.device.mul_dsps(op.left.size, op.right.size) != 1:
+                continue
+            pre = post = None
+            for n in g.operands[st]:    # pre-adder on port A, other operand on port B
+                if n not in stream or len(n.defs) != 1 or len(n.uses) != 1:
+                    continue
+                a = n.defs[0]
+                other = op.right if n.var is op.left else op.left
+                if (a.oplist[0].opc in (Opc.add, Opc.sub) and not a.clist and a.oplist[0] not in self.dsp
+                        and a.oplist[0].size <= pa and other.size <= pb):
+                    pre = a
+                    break
+            if len(m.uses) == 1:
+                a = m.uses[0]
+                if a.oplist[0].opc in (Opc.add, Opc.sub) and a.oplist[0] not in self.dsp \
+                        and a.oplist[0].size <= 48 and len(g.defnode[a].defs) == 1:
+                    post = a
+            if pre is None and post is None:    # multiply only, scheduled as fabric operator
+                continue
+            self.dsp[op] = "mul"
+            if pre is not None:
+                self.dsp[pre.oplist[0]] = "pre"
+            if post is not None:
+                self.dsp[post.oplist[0]] = "post"
+            self.dsp_groups.append((pre, st, post))
+        return len(self.dsp_groups)
+
+    def report_dsp(self, g, wires):  # DSP groups and their internal registers (after schedule)
+        targets = set([post.target for (pre, st, post) in self.dsp_groups if post is not None])
+        self.dsp_report = []
+        for (pre, st, post) in self.dsp_groups:
+            last = g.defnode[post or st]
+            first = pre or st
+            s = ""
+            regs = "AREG=" + str(int(not [n for n in g.operands[first]    # stream inputs from registers
+                                          if n in wires and n.stage == g.defnode[first].stage]))
+            if pre is not None:
+                s += pre.code(0).strip() + "; "
+                regs += " ADREG=" + str(int(g.defnode[st].stage > g.defnode[pre].stage))
+            s += st.code(0).strip()
+            if post is not None:
+                s += "; " + post.code(0).strip()
+                regs += " MREG=" + str(int(g.defnode[post].stage > g.defnode[st].stage))
+                if [x for x in [post.oplist[0].left, post.oplist[0].right] if x in targets]:
+                    regs += " PCIN"
+            s += " (" + regs + " PREG=" + str(int(last not in wires)) + ")"
+            self.dsp_report.append(s)
+            print ("DSP48: " + s, file=self.log)
+
+    def schedule(self, g):  # pipeline stages of values in topological order (self.stlist), return (levels, wires)
+        """
+- a value computed from stream values is a stream value at stage of its last operand + 1,
+  operands are the registers of the previous stage
+- with target clock period, a binary assignment is chained to the values (wires) of the
+  stage of its last operand while the accumulated delay fits in the period, else it starts
+  the next stage; conditional values are registered (if statement in clocked block)
+- self.delay: critical path delay of a stage
+        """
+        period = self.period
+        first = set([pre or st for (pre, st, post) in self.dsp_groups])  # DSP input registers
+        delay = {}          # value -> accumulated delay in its stage (wires and constant expressions)
+        regd = set([n for n in g.nodes if n.stream])    # registered stream values
+        wires = set()       # stream values used as wires in their stage
         pipe_levels = 0
-        self.get_statements(self.fn, Assign)   # Loop through Assignment statements
+        self.delay = 0.0
         for st in self.stlist:
-            self.get_variables(st.oplist[0])  # set varlist[] from expression, mark varlist_is_reg
-
-            level = max([v.reglevel for v in self.varlist]) + 1  # get max reglevel + 1
-            pipe_levels = max(pipe_levels, level)
-
-            if self.varlist_is_reg:
-                self.reg_namelist.append(st.target.name)    # add target to reg_namelist
-                st.target.reglevel = level                  # def target level
+            used = g.operands[st]
+            level = 0
+            ts = tn = 0.0   # delay of stream operands (at level) and other operands
+            for n in used:
+                if not n.stream:
+                    tn = max(tn, delay.get(n, 0.0))
+                    continue
+                if n in regd:
+                    l, t = n.stage + 1, 0.0
+                else:
+                    l, t = n.stage, delay[n]
+                if l > level:
+                    level, ts = l, t
+                elif l == level:
+                    ts = max(ts, t)
+            d = self.device.expr_delay(st.oplist[0], self.dsp)
+            if st.clist:    # conditional register assignment
+                d += self.device.mux(st.target.size)[0]
+            n1 = g.defnode[st]
+            if not [n for n in used if n.stream]:   # expression of constants and registers
+                if not st.clist:
+                    delay[n1] = tn + d
+                self.delay = max(self.delay, tn + d)
+                continue
+            if period and ts > 0 and (st in first or d > 0 and max(ts, tn) + d > period - self.device.register):
+                level += 1      # register the operands, start next stage
+                ts = 0.0
+            t = max(ts, tn) + d
+            self.delay = max(self.delay, t)
+            n1.stream = True
+            n1.stage = max(n1.stage, level)
+            pipe_levels = max(pipe_levels, n1.stage)
+            for n in used:      # operands chained in the stage
+                if n.stream and n.stage == level and n not in regd:
+                    wires.add(n)
+            if period and not [a for a in n1.defs if a.clist]:
+                delay[n1] = t   # wire, next operations can be chained
+            else:
+                regd.add(n1)
+        return pipe_levels, wires
 
-                self.set_variables(st.oplist[0], level-1)   # rename expr variables to level-1
+    def delay_register(self, g, n, level, levels):  # add assignment of register of value n at level
+        v = n.reg(self.fn, level)
+        if level == n.stage:            # get (level-1) variable
+            v2 = n.wire or n.var
+        else:
+            v2 = n.reg(self.fn, level-1)
+        if pipe_debug:
+            print ("Add delay "+v.name, file=self.log)
 
-                self.new_vardict[st.target.name] = st.target.name+"_z"+str(level)
-                st.target = self.fn.get_var(st.target.name+"_z"+str(level))  # def new target
-                st.target.register = True
-                st.target.reglevel = level
+        a = Assign(v)                   # generate assignment
+        a.addop(Op(v2, "load", None))
+        g.add_delay(a, n)
+        self.add_pipe_statement(a, levels)
+        return v
 
-                self.reg_varlist.append(st.target)          # finally add to reg_varlist
+    def pipeline_variables(self):   # transform statements to pipeline, mark registers
+        """
+Do assignment statements transformation from sequential to pipeline on the dataflow graph.
+- schedule: a value computed from stream values (registers) is a stream value at stage max(operand stage) + 1,
+  with target clock the binary assignments are scheduled on accumulated operator delay (schedule)
+- rename assignment targets and stream operands to the registers of their stages
+- add missing delay registers from end level (pipe_levels) to level 0
+- reorder assignments according to the level
+        """
+        if self.period:     # timing-driven: schedule binary assignments
+            print ("Decompose: "+str(self.decompbody(self.fn.body))+" new assignments.", file=self.log)
+            self.pm.invalidate("defuse")
+        g = self.pm.get("defuse")
+        if self.period and self.conf.dsp:
+            print ("DSP groups: " + str(self.map_dsp(g)), file=self.log)
+
+        for n in g.nodes:   # stream members (eg. a, b) start the pipeline
+            if not n.defs and is_stream_var(n.var.name):
+                n.stream = True
+
+        pipe_levels, wires = self.schedule(g)
+        self.report_dsp(g, wires)
+
+        for n in wires:     # output port is driven only by the return register, wire gets a new signal
+            if n.var.mode == Signal.outport:
+                n.wire = self.new_var(n.var.name+"_w", set())
+                self.fn.add_var(n.wire)
+
+        for st in self.stlist:  # rename stream operands and targets to registers
+            n = g.defnode[st]
+            if n.stream:
+                level = n.stage
+                n.var.reglevel = level  # def target level
+                regs = {}
+                for n1 in g.operands[st]:
+                    if n1.stream and not (n1 in wires and n1.stage == level):
+                        regs[n1.var] = n1.reg(self.fn, level-1)
+                    elif n1.wire is not None:
+                        regs[n1.var] = n1.wire
+                self.set_registers(st.oplist[0], regs)  # rename expr variables to level-1
+                if n not in wires:
+                    st.target = n.reg(self.fn, level)   # def new target
+                elif n.wire is not None:
+                    n.wire.reglevel = level
+                    st.target = n.wire
 
             if pipe_debug:
-                    print ("Level "+str(level)+": "+st.code(0), end="")
-
-        print ("Pipeline levels: "+str(pipe_levels))
+                    print ("Level "+str(n.stage)+": "+st.code(0), end="", file=self.log)
 
-        if pipe_debug:
-            print ("reg_namelist: ", end="")
-            for v1 in self.reg_namelist:
-                print (str(v1)+",", end="")
-            print ("")
+        print ("Pipeline levels: "+str(pipe_levels), file=self.log)
 
-            print ("reg_varlist: ", end="")
-            for v1 in self.reg_varlist:
-                print (v1.emit()+",", end="")
-            print ("\n")
+        levels = {}             # index statements by level
+        defined = set()         # registers with assignment
+        for st in self.stlist:
+            levels.setdefault(st.target.reglevel, []).append(st)
+            defined.add(st.target)
 
         # reverse order transformation: level = pipe_levels downto 0
         for level in reversed(range(pipe_levels)):
-
-            for st in self.stlist:  # find (level+1) Assign statement
-                if st.target.reglevel == level+1:
-
-                    self.get_variables(st.oplist[0])    # get expression variables
-                    varlist_n = len(self.varlist)
-                    if pipe_debug:
-                        print ("*** Check level "+str(level+1)+", "+str(varlist_n)+"-times")
-
-                    for n in range(varlist_n):  # loop through expression variables
-                        v = self.varlist[n]
-                        if pipe_debug:
-                            print (v.code(), end="")
-
-                        found = False           # search for variable assignment statement
-                        for st1 in self.stlist:
-                            if v == st1.target:
-                                found = True
-                                if pipe_debug:
-                                    print (" assignment found.")
-                                break
-
-                        if pipe_debug and not found:
-                            print (" NOT found! ", end="")
-                        if v.register and not found:    # if expression var = register and not found
-                            base_name = v.name.split('_')[0]  # get original var name TODO
-
-                            if pipe_debug and not found:
-                                print (" Add base_name = "+base_name)
-
-                            nv = self.fn.get_var(v.name)    # get new register variable
-                            nv.register = True
-                            nv.reglevel = level
-                            self.varlist.append(nv)         # immediately add to varlist
-
-                            if level == 0:                  # get (level-1) variable
-                                nv2 = self.fn.get_var(base_name)
-                            else:
-                                nv2 = self.fn.get_var(base_name+"_z"+str(level-1))
-                                nv2.register = True
-                                nv2.reglevel = level-1
-
-                            a = Assign(nv)                  # generate assignment
-                            a.addop(Op(nv2, "load", None))
-                            self.fn.body.add(a)
-                            self.stlist.append(a)
-                            # print (a.code(1))
+            for st in levels.get(level+1, []):  # (level+1) Assign statements read stage level registers
+                for n in g.operands[st]:
+                    if not n.stream or n.stage > level:     # wire of stage level+1
+                        continue
+                    v = n.regs[level]
+                    if v in defined:
+                        continue
+                    defined.add(self.delay_register(g, n, level, levels))
 
         if pipe_debug:
-            print ("*** Check return level ")
+            print ("*** Check return level ", file=self.log)
         for v in self.return_varlist:
-            if pipe_debug:
-                print("Return "+v.name)
-            # if v.name in self.conf.outputs:
-            #     v.setsize(14)
-            # else:
-            #     print ("Warning: output "+v.name+" is not in configuration! Set size: 16")
-            #     v.setsize(16)
-
+            n = g.current.get(v.name)
             a = Assign(v)                  # generate assignment
-            if v.name in self.new_vardict:
-                name2 = self.new_vardict[v.name]    # find original name
-                v2 = self.fn.get_var(name2)
-                a.addop(Op(v2, "load", None))  # TODO check level
-                self.fn.body.add(a)
-                self.stlist.append(a)
+            if n is not None and n.stream:
+                if n in wires and n.regs.get(n.stage) not in defined:  # register of wire at last stage
+                    defined.add(self.delay_register(g, n, n.stage, levels))
+                a.addop(Op(n.regs[n.stage], "load", None))
+                g.add(a, [n])
+                self.add_pipe_statement(a, levels)
             else:
-                print ("Can't find return variable " + v.name + " !")
-                exit(-1)
+                raise SynthError("Can't find return variable " + v.name + " !")
 
-        newstlist = []                          # order the statements into levels
+        levels = {}                             # order the statements into levels
+        for st in self.stlist:
+            levels.setdefault(st.target.reglevel, []).append(st)
+        newstlist = []
         for level in range(pipe_levels+1):
-            for st in self.stlist:
-                if st.target.reglevel == level:
-                    newstlist.append(st)
+            newstlist.extend(levels.get(level, []))
 
         self.fn.body.stlist = newstlist
-        # print (self.fn.code(0))
-        # exit()
+        self.pipe_levels = pipe_levels
+        if self.period:
+            print ("Target clock: %.1f MHz (%.3f ns)" % (1000.0/self.period, self.period), file=self.log)
+        print ("Latency: %d clock cycles, stage delay: %.3f ns, estimated Fmax: %.1f MHz" % (
+            self.latency(), self.delay, self.device.fmax(self.delay)), file=self.log)
+        if self.period and self.delay + self.device.register > self.period:
+            print ("Warning: target clock not met, operator or non-stream input path exceeds the period", file=self.log)
+
+    def latency(self):  # clock cycles from stream input to output (input register at level 0)
+        return self.pipe_levels + 1
+
+    def decompassign(self, st, stlist):  # append binary assignments of st expression and st to stlist (post-order)
+        targetname = st.target.name
+        sub = []
+        for op in st.oplist:  # loop through operators
+            if isinstance(op.left, Op):  # Expand Left Op
+                nv = self.new_var(targetname+"1", set())  # new variable, name not used in function
+                nv.setsize(op.left.size)
+                self.fn.add_var(nv)
+                a = Assign(nv)            # and assignment with op.left
+                a.addop(op.left)
+                op.left = nv       # replace op.left with variable
+                sub.append(a)
 
-    def decompbody(self, cbody):  # decompose body assignment statements to binary expressions
-        change = False
-        imax = len(cbody.stlist)
-        for i in range(imax):     # loop program statements
-            st = cbody.stlist[i]
+            if isinstance(op.right, Op):  # Expand Right Op
+                nv = self.new_var(targetname+"2", set())
+                nv.setsize(op.right.size)
+                self.fn.add_var(nv)
+                a = Assign(nv)
+                a.addop(op.right)
+                op.right = nv
+                sub.append(a)
+
+        n = len(sub)
+        for a in reversed(sub):  # right operand block, left operand block, then st
+            n += self.decompassign(a, stlist)
+        stlist.append(st)
+        return n  # number of new assignments
+
+    def decompbody(self, cbody):  # decompose body assignment statements to binary expressions in one pass
+        n = 0
+        stlist = []
+        for st in cbody.stlist:     # loop program statements
             if isinstance(st, IfElse):  # for both bodies of IfElse
-                change = change or self.decompbody(st.body)
+                n += self.decompbody(st.body)
                 # if not (st.elsbody is None):
-                #     change = change or decompbody(st.elsbody)  # TODO: error body?
+                #     n += self.decompbody(st.elsbody)  # TODO: error body?
+                stlist.append(st)
             elif isinstance(st, Assign):  # check assignments
-                targetname = st.target.name
-
-                jmax = len(st.oplist)
-                for j in range(jmax):  # loop through operators
-                    op = st.oplist[j]
-
-                    if isinstance(op.left, Op):  # Expand Left Op
-                        change = True
-                        nv = Var(targetname+"1")  # new variable
-                        self.fn.add_var(nv)
-                        a = Assign(nv)            # and assignment with op.left
-                        a.addop(op.left)
-                        op.left = nv       # replace op.left with variable
-                        cbody.insert(i, a)  # and insert
-
-                    if isinstance(op.right, Op):  # Expand Right Op
-                        change = True
-                        nv = Var(targetname+"2")
-                        self.fn.add_var(nv)
-                        a = Assign(nv)
-                        a.addop(op.right)
-                        op.right = nv
-                        cbody.insert(i, a)
-        return change
+                n += self.decompassign(st, stlist)
+            else:
+                stlist.append(st)
+        cbody.stlist = stlist
+        return n  # number of new assignments
 
     def evaluatebody(self, cbody):  # evaluate assigments in body
         # global stat
@@ -578,22 +1051,22 @@ Do assignment statements transformation from sequential to pipeline.
                         ls = left.size
                         ll = left.tree_level
                         if ll < 0 and not isinstance(op.left, Num):
-                            print ("EvaluateBody: variable "+left.name+" undefined in")
-                            print (st.code(0))
+                            print ("EvaluateBody: variable "+left.name+" undefined in", file=self.log)
+                            print (st.code(0), file=self.log)
                             return False
                         if isinstance(op.right, Lit):
                             right = op.right
                             rs = right.size
                             rl = right.tree_level
                             if rl < 0 and not isinstance(op.right, Num):
-                                print ("EvaluateBody: variable "+right.name+" undefined in")
-                                print (st.code(0))
+                                print ("EvaluateBody: variable "+right.name+" undefined in", file=self.log)
+                                print (st.code(0), file=self.log)
                                 return False
                         else:  # OPT: propagation!!
                             rs = 0
                             rl = 0
                     else:
-                        print ("EvaluateBody: expecting left Literal!")
+                        print ("EvaluateBody: expecting left Literal!", file=self.log)
 
                     if rl > ll:  # define result level
                         yl = rl + 1
@@ -603,28 +1076,27 @@ Do assignment statements transformation from sequential to pipeline.
                     st.target.tree_level = yl
                     self.var_tree(st.target.name, yl)
 
-                    if op.op == '+' or op.op == '-':
-                        self.naddsub += 1
-                        if ls > rs:
-                            es = ls + 1
-                        else:
-                            es = rs + 1
-                    elif op.op == '*':
-                        self.nmul += 1
-                        es = ls + rs
-                    elif op.op == '>>':
-                        es = ls - (right.value)
-                    elif op.op == 'load' or op.op == '':
-                        if ls >= rs:
-                            es = ls
-                        else:
-                            es = rs
-                    else:
-                        es = 0  # unknown op
+                    if op.opc == Opc.shr or op.opc == Opc.shl:
+                        rs = right.value
+                    es = self.op_size(op, ls, rs)  # resources are counted by analysis
+
+                    rng = None  # value interval from operand intervals
+                    if isinstance(op.left, Lit):
+                        lr = self.var_range(op.left)
+                        rr = lr
+                        if isinstance(op.right, Lit):
+                            rr = self.var_range(op.right)
+                        rng = self.op_range(op, lr, rr)
+                    if rng is not None and es > 1:
+                        if st.clist and st.target in self.ranges:   # conditional assignments: union
+                            r0 = self.ranges[st.target]
+                            rng = (min(r0[0], rng[0]), max(r0[1], rng[1]))
+                        self.ranges[st.target] = rng
+                        es = max(self.range_bits(rng), 2)
 
                     if st.target.mode == Signal.outport:
-                        if st.target.size != es:
-                            print ("Warning: output '"+st.target.name+"' resized from "+str(es)+" to "+str(st.target.size))
+                        if st.target.size < es:     # value range exceeds output
+                            print ("Warning: output '"+st.target.name+"' resized from "+str(es)+" to "+str(st.target.size), file=self.log)
                     else:
                         st.target.setsize(es)  # set size of target var
                     # print ("Size: "+str(es)+":"+op.left.name+"="+str(ls)+","+op.right.name+"="+str(rs))
@@ -632,26 +1104,82 @@ Do assignment statements transformation from sequential to pipeline.
 
 
     def pipe_transform(self):  # transformation and assignment evaluation
-        print ("-------- Transform: -------------")  # p = deepcopy(prog)
+        print ("-------- Transform: -------------", file=self.log)  # p = deepcopy(prog)
 
-        self.conditions_assign(self.fn.body, 0)  # convert if-else to conditional assignments
+        for name in transform_passes:
+            self.pm.run(name)
+        print ("-------- END Transform: ---------", file=self.log)
+        self.done = "transform"
 
-        self.pipeline_variables()  # transform dataflow assignments to pipeline
+    def decompose(self):  # expand assignments to binary expressions
+        n = self.decompbody(self.fn.body)
+        print ("Decompose: "+str(n)+" new assignments.", file=self.log)
+        return n
 
-        # print ("FN: "+self.fn.code(0))
-        i = 1
-        while self.decompbody(self.fn.body):  # expand assignments to binary expressions
-            i += 1
-        print ("Decompose "+str(i)+"-times.")
-
-        if self.evaluatebody(self.fn.body):
-            self.report()
-        else:
-            exit(-1)
+    def evaluate(self):  # evaluate target sizes and dataflow levels, report resources
+        if not self.evaluatebody(self.fn.body):   # message is in log
+            raise SynthError("EvaluateBody: evaluation failed")
+        self.report()
 
+    def required_widths(self):  # remove MSBs of internal values not needed by their uses, return bits removed
+        """
+Backward from outputs: low bits of add, sub, mul results depend only on the same
+low bits of the operands, x << k needs k bits less of x, x >> k needs k bits more.
+A value needs the maximum of its uses: all bits for comparisons and conditions,
+the output size for outputs. Internal values are kept in their required width,
+the MSBs above it are not computed or registered (values wrap, as at the outputs).
+LSBs are not removed: discarding them before >> changes the carries in general.
+Signals with values beyond their size wrap (MyHDL modbv, intbv would overflow).
+        """
+        stlist = [st for st in self.fn.body.stlist if isinstance(st, Assign)]
+        full = set()    # variables used in conditions
+        for st in stlist:
+            for (cond, b) in st.clist:
+                full.update(expr_vars(cond.oplist[0], []))
+        req = {}        # variable -> required bits
+        total = saved = 0
+        for st in reversed(stlist):     # uses before assignments
+            op = st.oplist[0]
+            v = st.target
+            w = v.size
+            if v.mode == Signal.int and v not in full and w > 1 and v in req:
+                w = max(min(w, req[v]), 2)
+                if w < v.size:
+                    saved += v.size - w
+                    v.setsize(w)
+            if op.opc in (Opc.add, Opc.sub, Opc.mul, Opc.load):
+                need = w
+            elif op.opc == Opc.shl:
+                need = w - op.right.value
+            elif op.opc == Opc.shr:
+                need = w + op.right.value
+            else:                       # comparison, logic: all bits
+                need = None
+            for x in [op.left, op.right]:
+                if isinstance(x, Var):
+                    n = x.size
+                    if need is not None:
+                        n = max(min(need, x.size), 1)
+                    req[x] = max(req.get(x, 0), n)
+            if op.opc in (Opc.add, Opc.sub, Opc.mul, Opc.shl, Opc.shr):
+                op.size = w     # operator width for timing and resources
+        wraps = 0
+        for v in self.fn.vardict.values():
+            if v.mode == Signal.int:
+                total += v.size
+            r = self.ranges.get(v)
+            if r is not None and v.size > 1 and self.range_bits(r) > v.size:  # removed MSBs, resized outputs
+                v.wrap = True
+                wraps += 1
+        print ("Widths: %d bits of internal signals, %d MSBs removed, %d signals wrap" % (total, saved, wraps),
+               file=self.log)
+        return saved
+
+    def conditions_body(self):  # group conditional assignments of function body into if statements
         if_list = []
         if_level = 0
         if_last_cond = []
+        later = set()   # targets of unconditional assignments after the last if statement
 
         self.get_statements(self.fn)    # loop through statements
         # numst = len(self.stlist)
@@ -666,33 +1194,39 @@ Do assignment statements transformation from sequential to pipeline.
                 if st.clist:            # conditional assignment
                     if if_list:         # check current list of if statements, if0 = last if
                         if0 = if_list[-1]
-                        if st.clist[-1][0] == if0.cond:  # assign in existing if
+                        if st.clist[-1][0] == if0.cond and st.target not in later:  # assign in existing if
                             if st.clist[-1][1]:          # select true body ?
                                 if0.truebody = True     # maybe not necessary
                             else:                       # select else body
                                 if not if0.elsbody:
                                     if0.elsbody = Body(if0.scopeblock.body.level+1)
-                                    if0.truebody = False
+                                if0.truebody = False    # also back from true body (next stage)
 
                             if0.add_to_body(st)         # add statement to if
                         else:                           # different if, TODO levels
                             if_list.pop()
                             ist = IfElse(self.fn)  # new IF statement
                             ist.cond = st.clist[-1][0]  # set condition
+                            if not st.clist[-1][1]:     # starts with else body
+                                ist.elsebody(self.fn)
                             ist.add_to_body(st)
                             fnbody.add(ist)
                             if_list.append(ist)
+                            later = set()
                     else:
                         ist = IfElse(self.fn)  # new IF statement
                         ist.cond = st.clist[0][0]  # set condition
+                        if not st.clist[0][1]:     # starts with else body
+                            ist.elsebody(self.fn)
                         ist.add_to_body(st)
                         fnbody.add(ist)
                         if_list.append(ist)
+                        later = set()
                 else:
                     fnbody.add(st)
+                    later.add(st.target)        # register default value: next conditional assignment after it
 
         self.fn.body = fnbody
-        print ("-------- END Transform: ---------")
 
 ################################################################################################
 ######## MyHDL Code generation
@@ -712,7 +1246,23 @@ Do assignment statements transformation from sequential to pipeline.
             if isinstance(st, Return):  # remove return from statement list !
                 del fnbody.stlist[i]
 
-    def wrap(self):
+    def wrap(self):  # build MyHDL wrapper, return generated code
+        self.pm.run("build_wrapper")
+        w = Writer()
+        self.write_wrapper(w)
+        return w.getvalue()
+
+    def static_timing(self):  # timing paths and resources of the wrapper, report, return critical path
+        self.paths, self.resources = timing.static_timing(self, self.device)
+        return timing.write_report(self.log, self.paths, self.resources, self.device, self.period)
+
+    def write_wrapper(self, f):  # stream MyHDL code of the wrapper to file-like f
+        f.write("from myhdl import *\n")
+        self.myp.write(f)
+        f.write("\ntoVerilog("+self.vlist+")\n")
+        # f.write("toVHDL("+self.vlist+")\n")
+
+    def build_wrapper(self):  # build MyHDL program (self.myp) and toVerilog port list (self.vlist)
         # self.get_function()
         # fname = fn.name
         self.fn.decorator = "@always(clk.posedge)"
@@ -729,14 +1279,10 @@ Do assignment statements transformation from sequential to pipeline.
         myp_fn.add_var(clk)
 
         intlevel = 0
-        stmax = len(self.fn.body.stlist)  # search for assignment with target = int
-        # print ("STMAX="+str(stmax))
-        for i in range(stmax):
-            st = self.fn.body.stlist[i]
+        for st in self.fn.body.stlist:  # search for assignment with target = int
             if isinstance(st, Assign):
                 if (not st.target.register) and st.target.tree_level > intlevel:
                     intlevel = st.target.tree_level
-                # print (str(intlevel) + " " + str(st.target.tree_level) + " " + st.code(0))
 
         for v in myp_fn.vardict.values():  # declare signals for all .int variables
             if v.mode == Signal.int:
@@ -744,30 +1290,41 @@ Do assignment statements transformation from sequential to pipeline.
                 ast.addop(Op(None, "signal", None))
                 myp_fn.add_to_body(ast)
 
-        for j in range(intlevel):  # combinational block for each intlevel
-            comb = Function("comb"+str(j), myp_fn)
-            comb.decorator = "@always_comb"
-
-            # transfer assignments with int variables from fn to comb
-            newlist = []
-            stmax = len(self.fn.body.stlist)
-            added = False
-            for i in range(stmax):
-                st = self.fn.body.stlist[i]
-                if isinstance(st, Assign):  # search assignment with target = int
-                    if (not st.target.register) and st.target.tree_level == j+1:
-                        comb.add_to_body(st)  # add to comb or
-                        added = True
-                    else:                   # to new list
-                        newlist.append(st)
-                else:
-                    newlist.append(st)
-
-            self.fn.body.stlist = newlist
+        # transfer assignments with int variables from fn to comb block of their tree level
+        comblist = {}
+        newlist = []
+        for st in self.fn.body.stlist:
+            if isinstance(st, Assign) and (not st.target.register) and 0 < st.target.tree_level <= intlevel:
+                comblist.setdefault(st.target.tree_level, []).append(st)
+            else:
+                newlist.append(st)
+        self.fn.body.stlist = newlist
 
-            if added:
+        for j in range(intlevel):  # combinational block for each intlevel
+            if j+1 in comblist:
+                comb = Function("comb"+str(j), myp_fn)
+                comb.decorator = "@always_comb"
+                for st in comblist[j+1]:
+                    comb.add_to_body(st)
                 myp_fn.add_to_body(comb)
 
+        # registers of DSP groups (ADREG, MREG, PREG) to clocked block of each group
+        self.dsp_blocks = {}
+        top = set(self.fn.body.stlist)  # unconditional register assignments of clocked block
+        moved = set()
+        for i in range(len(self.dsp_groups)):
+            dsp = Function("dsp"+str(i), myp_fn)
+            dsp.decorator = "@always(clk.posedge)"
+            for st in self.dsp_groups[i]:
+                if st in top and st.target.register:
+                    dsp.add_to_body(st)
+                    moved.add(st)
+            if dsp.body.stlist:
+                myp_fn.add_to_body(dsp)
+                self.dsp_blocks[dsp.name] = self.dsp_report[i]
+        if moved:
+            self.fn.body.stlist = [st for st in self.fn.body.stlist if st not in moved]
+
         myp_fn.add_to_body(self.fn)
 
         # r1 = Return([Var(fname), Var("comb")])
@@ -794,42 +1351,265 @@ Do assignment statements transformation from sequential to pipeline.
                 ast.addop(Op(None, "signal", None))
                 myp.add_to_body(ast)
 
-        gen = "from myhdl import *\n"
-        gen += myp.code()
-        gen += "\ntoVerilog("+vlist+")\n"
-        # gen += "toVHDL("+vlist+")\n"
-
-        return gen
+        self.myp = myp
+        self.vlist = vlist
+        self.done = "wrapper"
 ################################################################################################
 #
 # Test transformations
-# first set source path and filename
-dir = "work"
-os.chdir(dir)
-filename = "test.py"
-# Parse Python function
-p = Par().compile(filename)
-print(p.code())
-# Read configuration file
-c = Conf("rp.ini")
-# Call dataflow transformation with parser and configuration object
-t = Transf(p, c)
-# analysis: get function, analyze dataflow, convert
-t.analyze()
-# transform to pipeline, generate wrapper and save to output file (MyHDL)
-t.pipe_transform()
-# print (p.emit())
-my = t.wrap()
-fo = open("proc.py", 'w')
-fo.write(my)
-fo.close()
-print (my)
-# run MyHDL to generate Verilog output and generate interface for Red Pitaya board
-# os.system('python proc.py')
-oif = Interface(c)
-outif = oif.compile()
-fif = open("red_pitaya_proc.v", 'w')
-fif.write(outif)
-fif.close()
-#
-# print (outif)
+def synthesize(source, config, template=None, name="test", log=None, prof=None, stats=None, save=None):
+    """Synthesize pipeline from Python function source text.
+
+    source: text, parsed program (PyProg, not changed by synthesis) or
+    Transf of a checkpoint (continue after its last phase),
+    config: ini text or Conf object (not used for Transf source),
+    template: interface template text (default: sigproc.tmp of the tool),
+    log: file-like for messages (default: discarded), prof: phase
+    profiler, stats: dictionary to fill with resources and pipeline
+    levels, save: directory to save checkpoints of the phases.
+    Returns artifacts {file name: text} for proc.py (MyHDL), proc.v
+    (Verilog) and red_pitaya_proc.v
+    """
+    if log is None:
+        log = Writer()
+    if prof is None:
+        prof = NoProfiler()
+    if template is None:
+        f = open(template_file, 'r')
+        template = f.read()
+        f.close()
+    if save is not None:
+        import checkpoint
+    if isinstance(source, Transf):  # resume from checkpoint
+        t = source
+        t.prof = t.pm.prof = prof
+        t.log = log
+        c = t.conf
+    else:
+        # Parse Python function
+        if isinstance(source, PyProg):
+            p = source
+        else:
+            with prof.phase("parse") as ph:
+                p = AstPar(log).parse(source, name)
+                ph.ir = p
+            print (name + ".py", file=log)
+            print (p.code(), file=log)
+            if save is not None:
+                checkpoint.save(save, name, "parse", p)
+        # Read configuration
+        with prof.phase("config"):
+            c = config
+            if not isinstance(c, Conf):
+                c = Conf(text=config, log=log)
+        # Call dataflow transformation with parser and configuration object
+        t = Transf(p, c, prof, log)
+    # analysis: get function, analyze dataflow, convert
+    if t.done == "":
+        with prof.phase("analyze", t.prg):
+            t.analyze()
+        if save is not None:
+            checkpoint.save(save, name, t.done, t)
+    # transform to pipeline, generate wrapper (MyHDL)
+    if t.done == "analyze":
+        with prof.phase("pipe_transform", t.prg):
+            t.pipe_transform()
+        if save is not None:
+            checkpoint.save(save, name, t.done, t)
+    with prof.phase("wrap") as ph:
+        if t.done == "transform":
+            t.pm.run("build_wrapper")
+            if save is not None:
+                checkpoint.save(save, name, t.done, t)
+        ph.ir = t.myp
+        crit = t.pm.run("static_timing")
+        if stats is not None:
+            (luts, ffs, dsps) = t.resources
+            stats.update({"addsub": t.naddsub, "mul": t.nmul, "levels": t.pipe_levels, "latency": t.latency(),
+                          "fmax": t.device.fmax(crit.delay if crit else 0.0), "luts": luts, "ffs": ffs,
+                          "dsps": dsps, "dsp_groups": len(t.dsp_groups), "dsp_saved": t.dsp_saved,
+                          "passes": t.pm.timings()})
+        with prof.phase("write_wrapper"):
+            w = Writer()
+            t.write_wrapper(w)
+        with prof.phase("write_verilog"):
+            wv = Writer()
+            write_verilog(t, wv)    # direct Verilog, same module as MyHDL toVerilog
+    # generate interface for Red Pitaya board
+    with prof.phase("interface"):
+        outif = Interface(c, log).compile(template)
+    return {"proc.py": w.getvalue(), "proc.v": wv.getvalue(), "red_pitaya_proc.v": outif}
+
+
+def resume(fname, config=None, template=None, log=None, prof=None, stats=None, save=None):
+    """Continue synthesis from checkpoint file, return artifacts (see synthesize).
+
+    config (ini text or Conf) is needed for a parse checkpoint only, the
+    later checkpoints include the configuration.
+    """
+    import checkpoint
+    (name, phase, x) = checkpoint.load(fname)
+    if phase == "parse" and config is None:
+        raise ValueError("resume: configuration needed for parse checkpoint " + fname)
+    return synthesize(x, config, template, name, log, prof, stats, save)
+
+
+def synthesize_variants(source, configs, template=None, name="test", threads=1):
+    """Synthesize one function for a list of configurations (ini text or Conf).
+
+    The source is parsed once and each variant transforms its own copy of
+    the program, so variants can run in parallel threads. Returns list of
+    artifacts; the first synthesis error (SynthError) is raised.
+    """
+    if isinstance(source, PyProg):
+        p = source
+    else:
+        p = AstPar(Writer()).parse(source, name)
+    if template is None:
+        f = open(template_file, 'r')
+        template = f.read()
+        f.close()
+    results = [None] * len(configs)
+
+    def run(i):
+        try:
+            results[i] = synthesize(p, configs[i], template, name)
+        except Exception as e:  # keep worker thread alive, raise in caller
+            results[i] = e
+
+    if threads > 1:
+        from multiprocessing.pool import ThreadPool
+        pool = ThreadPool(threads)
+        pool.map(run, range(len(configs)))
+        pool.close()
+        pool.join()
+    else:
+        for i in range(len(configs)):
+            run(i)
+    for r in results:
+        if isinstance(r, Exception):
+            raise r
+    return results
+
+
+def write_text(fname, s):
+    f = open(fname, 'w')
+    f.write(s)
+    f.close()
+
+
+def clock_conf(initext, clock, log=None):  # configuration with target clock (MHz) replacing the ini clock
+    if not clock:
+        return initext
+    c = Conf(text=initext, log=log)
+    c.clock = clock
+    return c
+
+
+def main(argv=None):  # command line: synthesize function file to MyHDL and interface files
+    import argparse
+    ap = argparse.ArgumentParser(description="Python pipeline synthesis tool")
+    ap.add_argument("input", nargs="?", default=os.path.join("work", "test.py"), help="Python function file (work/test.py)")
+    ap.add_argument("-c", "--ini", help="board configuration file (rp.ini next to input)")
+    ap.add_argument("-t", "--template", help="interface template (sigproc.tmp next to input or of the tool)")
+    ap.add_argument("-o", "--outdir", help="output directory (input directory)")
+    ap.add_argument("--proc", help="MyHDL output file (outdir/proc.py)")
+    ap.add_argument("--verilog", help="Verilog output file (outdir/proc.v)")
+    ap.add_argument("--iface", help="interface output file (outdir/red_pitaya_proc.v)")
+    ap.add_argument("--no-cache", action="store_true", help="do not use output cache (outdir/"+cache_dir+")")
+    ap.add_argument("--profile", action="store_true", help="save phase profile to outdir/proc_profile.json")
+    ap.add_argument("--checkpoints", metavar="DIR", help="save checkpoints of the phases to DIR")
+    ap.add_argument("--resume", metavar="FILE", help="continue from checkpoint FILE (input is not read)")
+    ap.add_argument("--clock", type=float, metavar="MHZ", help="target clock for timing-driven pipeline ([timing] clock of ini)")
+    ap.add_argument("-w", "--watch", action="store_true", help="watch input, ini and template, resynthesize on change")
+    ap.add_argument("-q", "--quiet", action="store_true", help="no messages")
+    args = ap.parse_args(argv)
+
+    indir = os.path.dirname(args.input)
+    outdir = args.outdir or indir
+    ini = args.ini or os.path.join(indir, "rp.ini")
+    template = args.template or os.path.join(indir, "sigproc.tmp")
+    if not args.template and not os.path.exists(template):
+        template = template_file
+    paths = {"proc.py": args.proc or os.path.join(outdir, "proc.py"),
+             "proc.v": args.verilog or os.path.join(outdir, "proc.v"),
+             "red_pitaya_proc.v": args.iface or os.path.join(outdir, "red_pitaya_proc.v")}
+    log = None
+    if args.quiet:
+        log = Writer()
+
+    if not os.path.isdir(outdir or "."):
+        os.makedirs(outdir)
+    if args.checkpoints and not os.path.isdir(args.checkpoints):
+        os.makedirs(args.checkpoints)
+    if args.watch:
+        from watch import Watcher
+        Watcher(args.input, ini, template, paths, log, args.clock).run()
+        return 0
+    prof = None
+    if profile or args.profile:
+        from prof import Profiler
+        prof = Profiler()
+    try:
+        return compile_files(args, ini, template, paths, outdir, log, prof)
+    finally:
+        if prof is not None:
+            prof.close()    # stop memory tracing of the profiler
+
+
+def compile_files(args, ini, template, paths, outdir, log, prof):  # synthesize or resume of main, return exit code
+    if args.resume:
+        initext = None
+        if os.path.exists(ini):
+            initext = clock_conf(read_text(ini), args.clock, log)
+        try:
+            out = resume(args.resume, initext, read_text(template), log or sys.stdout, prof, None, args.checkpoints)
+        except SynthError as e:
+            print ("Error: " + str(e), file=sys.stderr)
+            return 1
+        for name in outputs:
+            write_text(paths[name], out[name])
+        return 0
+
+    source = read_text(args.input)
+    initext = read_text(ini)
+    tmpl = read_text(template)
+    # Return stored outputs if function, configuration, template and tool did not change
+    cache = key = None
+    if cache_dir is not None and not args.no_cache and not args.checkpoints:
+        from cache import Cache, tool_version
+        cache = Cache(os.path.join(outdir, cache_dir))
+        ver = tool_version()
+        if args.clock:
+            ver += "-clock" + str(args.clock)
+        key = cache.key(source, initext, tmpl, ver)
+        out = cache.get(key)
+        if out is not None and sorted(out) == sorted(outputs):
+            for name in outputs:
+                write_text(paths[name], out[name])
+            print ("Cache hit: " + ", ".join(outputs) + " unchanged (" + key[:12] + ")", file=log)
+            return 0
+
+    name = os.path.basename(args.input)
+    if name.endswith(".py"):
+        name = name[:-3]
+    try:
+        out = synthesize(source, clock_conf(initext, args.clock, log), tmpl, name, log or sys.stdout, prof, None, args.checkpoints)
+    except SynthError as e:
+        print ("Error: " + str(e), file=sys.stderr)
+        return 1
+    for name in outputs:
+        write_text(paths[name], out[name])
+    if not args.quiet:
+        print (out["proc.py"])
+    if cache is not None:
+        cache.put(key, out)
+    if prof is not None:
+        prof.report()
+        prof.save(os.path.join(outdir, "proc_profile.json"))  # next to proc.py
+    return 0
+
+
+if __name__ == "__main__":
+    import PyPipeSynth  # checkpoints refer to PyPipeSynth.Transf, not __main__.Transf
+    sys.exit(PyPipeSynth.main())
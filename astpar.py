@@ -0,0 +1,187 @@
+# -------------------------------------------------------------------------------
+# astpar.py
+#
+# Python (limited syntax) parser for pipeline synthesis tool, ast front end
+# Parses with Python's ast module and lowers the tree to the pyprog classes,
+# producing the same program structure as par.Par
+#
+# Copyright (C) 2017, Andrej Trost
+# License: MIT
+# -------------------------------------------------------------------------------
+from __future__ import print_function
+import ast
+import gc
+from pyprog import Signal, Var, Num, Bool, Op, Condition, Assign, Return, IfElse, Function, PyProg, ParseError
+
+binops = {ast.Add: '+', ast.Sub: '-', ast.Mult: '*', ast.RShift: '>>', ast.LShift: '<<'}
+cmpops = {ast.Eq: '==', ast.NotEq: '!=', ast.GtE: '>=', ast.LtE: '<=', ast.Gt: '>', ast.Lt: '<'}
+boolops = {ast.And: 'and', ast.Or: 'or'}
+Constant = getattr(ast, "Constant", None) or ast.Num  # Python 3.8+ constants, ast.Num before
+
+
+class AstPar:
+
+    def __init__(self, log=None):
+        self.name = ""
+        self.sline = 1  # line for error report
+        self.log = log  # file-like for messages (None: stdout)
+        print ("Parse ", end="", file=self.log)
+
+    def error(self, s):
+        raise ParseError(s, self.sline)
+
+    def leaf(self, block, node):  # variable or constant, None if node is not a leaf
+        t = type(node)
+        if t is ast.Name:
+            if node.id in ("True", "False"):  # Python 2: True, False are names
+                return Bool(node.id)
+            return block.get_var(node.id)
+        if t is Constant:
+            value = getattr(node, "value", getattr(node, "n", None))  # ast.Num: n
+            if isinstance(value, bool):
+                return Bool(str(value))
+            if isinstance(value, int):
+                return Num(str(value))
+        return None
+
+    def expression(self, block, node):  # return expression tree (Op) or leaf (Lit)
+        t = type(node)
+        if t is ast.BinOp:
+            op = binops.get(type(node.op))
+            if op is None:
+                self.error("Unsupported operator " + type(node.op).__name__)
+            return Op(self.expression(block, node.left), op, self.expression(block, node.right))
+
+        if t is ast.Compare:  # chained comparison is folded to the left as in par.Par
+            l = self.expression(block, node.left)
+            for op, right in zip(node.ops, node.comparators):
+                if type(op) not in cmpops:
+                    self.error("Unsupported comparison " + type(op).__name__)
+                l = Op(l, cmpops[type(op)], self.expression(block, right))
+            return l
+
+        if t is ast.BoolOp:
+            l = self.expression(block, node.values[0])
+            for right in node.values[1:]:
+                l = Op(l, boolops[type(node.op)], self.expression(block, right))
+            return l
+
+        if t is ast.UnaryOp and type(node.op) is ast.Not:
+            return Op(None, 'not', self.expression(block, node.operand))
+
+        l = self.leaf(block, node)
+        if l is None:
+            self.error("Unsupported expression " + t.__name__)
+        return l
+
+    def condition(self, block, node):
+        c = Condition()
+        e = self.expression(block, node)
+        if isinstance(e, Op):
+            c.addop(e)
+        else:
+            c.addop(Op(e, '&', None))  # operacija Load
+        return c
+
+    def assignment(self, block, node):
+        if len(node.targets) != 1 or not isinstance(node.targets[0], ast.Name):
+            self.error("Expected assignment to a single variable")
+        v = block.get_var(node.targets[0].id)
+        a = Assign(v)
+        e = self.expression(block, node.value)
+        if isinstance(e, Op):
+            a.addop(e)
+        else:
+            a.addop(Op(e, '', None))
+        return a
+
+    def doif(self, block, node):  # referenca na block zaradi spremenljivk
+        c = self.condition(block, node.test)
+
+        st = IfElse(block)  # superblock
+        st.cond = c
+        self.compblock(st, node.body)
+
+        if node.orelse:
+            st.elsebody(block)
+            self.compblock(st, node.orelse)
+
+        return st
+
+    def doreturn(self, block, node):  # return variable or tuple of variables
+        if isinstance(node.value, ast.Tuple):
+            names = node.value.elts
+        else:
+            names = [node.value]
+
+        varlist = []
+        for n in names:
+            if not isinstance(n, ast.Name):
+                self.error("Expected return variable")
+            v = block.get_var(n.id)
+            v.settype(Signal.outport)  # definiraj tip
+            varlist.append(v)
+        return Return(varlist)
+
+    def function(self, block, node):
+        fn = Function(node.name, block)  # ime in superblock
+
+        for arg in node.args.args:
+            name = getattr(arg, "arg", None) or arg.id  # Python 3: ast.arg, Python 2: ast.Name
+            v = Var(name)
+            v.settype(Signal.inport)  # definiraj tip in level?
+            v.set_tree_level(0)     # mark initial data flow level = 0
+            fn.add_var(v)           # in dodaj v blok
+
+        return self.compblock(fn, node.body)
+
+    def statement(self, block, node):
+        self.sline = node.lineno
+        if isinstance(node, ast.Assign):
+            block.add_to_body(self.assignment(block, node))
+        elif isinstance(node, ast.If):
+            block.add_to_body(self.doif(block, node))
+        elif isinstance(node, ast.Return):
+            if node.value is None:
+                self.error("Expected return variable")
+            block.add_to_body(self.doreturn(block, node))
+        elif isinstance(node, ast.FunctionDef):
+            block.body.add(self.function(block, node))
+        else:
+            self.error("Unexpected statement: " + type(node).__name__)
+
+    def compblock(self, block, stmts):  # prevedi blok kode
+        for node in stmts:
+            self.statement(block, node)
+        return block
+
+    def parse(self, src, name):  # parse source string, return program
+        self.name = name
+        enabled = gc.isenabled()
+        gc.disable()    # syntax tree and IR are many new objects, no garbage: collection is about 1/3 of the time
+        try:
+            try:
+                tree = ast.parse(src)
+            except SyntaxError as e:
+                self.sline = e.lineno
+                self.error(str(e.msg))
+
+            prog = PyProg(self.name)
+            self.compblock(prog, tree.body)
+        finally:
+            if enabled:
+                gc.enable()
+        return prog
+
+    def compile(self, fname):
+        if fname == "":
+            return
+        name = fname
+        if fname.endswith(".py"):
+            name = fname[:-3]
+        f = open(fname, 'r')
+        src = f.read()
+        f.close()
+        print (fname, file=self.log)
+
+        return self.parse(src, name)
@@ -0,0 +1,145 @@
+# -------------------------------------------------------------------------------
+# batch.py
+#
+# Batch compilation for pipeline synthesis tool: compile many kernels
+# (function file + ini file pairs) in a process pool, one output directory
+# per kernel, and write a summary table of timings, resources and failures
+# run: python batch.py [-j N] [-o outdir] kernels/*.py
+#      python batch.py [-j N] [-o outdir] -m manifest
+# manifest: one "function.py [file.ini]" pair per line, # comments
+# ini: given in manifest, else <name>.ini, else rp.ini next to the function file
+#
+# Copyright (C) 2017, Andrej Trost
+# License: MIT
+# -------------------------------------------------------------------------------
+from __future__ import print_function
+import glob
+import os
+import sys
+import time
+from pyprog import Writer, SynthError
+from PyPipeSynth import synthesize, read_text, write_text, template_file, outputs
+
+clock = getattr(time, "perf_counter", time.time)
+
+
+def kernel_ini(fname):  # default ini file of function file
+    ini = fname[:-3] + ".ini" if fname.endswith(".py") else fname + ".ini"
+    if not os.path.exists(ini):
+        ini = os.path.join(os.path.dirname(fname), "rp.ini")
+    return ini
+
+
+def read_manifest(fname):  # return list of (function file, ini file), paths relative to manifest
+    d = os.path.dirname(fname)
+    jobs = []
+    for line in read_text(fname).splitlines():
+        line = line.split("#")[0].split()
+        if not line:
+            continue
+        src = os.path.join(d, line[0])
+        if len(line) > 1:
+            jobs.append((src, os.path.join(d, line[1])))
+        else:
+            jobs.append((src, kernel_ini(src)))
+    return jobs
+
+
+def job_name(src):
+    name = os.path.basename(src)
+    if name.endswith(".py"):
+        name = name[:-3]
+    return name
+
+
+def run_job(job):  # compile one kernel, return result dictionary (never raises)
+    (src, ini, outdir, template) = job
+    name = job_name(src)
+    res = {"name": name, "source": src, "ini": ini, "ok": False, "error": "", "time_s": 0.0}
+    log = Writer()
+    t0 = clock()
+    try:
+        stats = {}
+        out = synthesize(read_text(src), read_text(ini), template, name, log, None, stats)
+        d = os.path.join(outdir, name)
+        if not os.path.isdir(d):
+            os.makedirs(d)
+        for fname in outputs:
+            write_text(os.path.join(d, fname), out[fname])
+        res.update(stats)
+        res["ok"] = True
+    except SynthError as e:  # parser or transformation error
+        res["error"] = str(e)
+    except Exception as e:
+        res["error"] = "%s: %s" % (e.__class__.__name__, e)
+    res["time_s"] = clock() - t0
+    if not res["ok"]:
+        write_text(os.path.join(outdir, name + ".log"), log.getvalue())
+    return res
+
+
+def summary(results, total):  # summary table text
+    s = "%-20s %-6s %9s %8s %6s %7s  %s\n" % ("kernel", "status", "time (s)", "ADD/SUB", "MUL", "levels", "error")
+    for r in results:
+        if r["ok"]:
+            s += "%-20s %-6s %9.3f %8d %6d %7d\n" % (r["name"], "ok", r["time_s"], r["addsub"], r["mul"], r["levels"])
+        else:
+            s += "%-20s %-6s %9.3f %8s %6s %7s  %s\n" % (r["name"], "FAIL", r["time_s"], "-", "-", "-", r["error"])
+    nok = len([r for r in results if r["ok"]])
+    s += "%d kernels, %d ok, %d failed, %.3f s (jobs %.3f s)\n" % (
+        len(results), nok, len(results)-nok, total, sum([r["time_s"] for r in results]))
+    return s
+
+
+def compile_batch(jobs, outdir, nproc=None, template=None):  # jobs: list of (function file, ini file)
+    import multiprocessing
+    if template is None:
+        template = read_text(template_file)
+    if not os.path.isdir(outdir):
+        os.makedirs(outdir)
+    names = [job_name(src) for (src, ini) in jobs]
+    if len(set(names)) != len(names):
+        raise ValueError("batch: duplicate kernel names")
+    t0 = clock()
+    work = [(src, ini, outdir, template) for (src, ini) in jobs]
+    if nproc == 1:
+        results = [run_job(job) for job in work]
+    else:
+        pool = multiprocessing.Pool(nproc)
+        try:
+            results = pool.map(run_job, work, 1)
+        finally:
+            pool.close()
+            pool.join()
+    return results, clock() - t0
+
+
+def main(argv=None):
+    import argparse
+    ap = argparse.ArgumentParser(description="Pipeline synthesis batch compilation")
+    ap.add_argument("files", nargs="*", help="function files or glob patterns")
+    ap.add_argument("-m", "--manifest", help="manifest file of function and ini pairs")
+    ap.add_argument("-o", "--outdir", default="build", help="output directory (build)")
+    ap.add_argument("-j", "--jobs", type=int, help="worker processes (number of CPUs)")
+    args = ap.parse_args(argv)
+
+    jobs = []
+    if args.manifest:
+        jobs += read_manifest(args.manifest)
+    for pattern in args.files:
+        for src in sorted(glob.glob(pattern)) or [pattern]:
+            jobs.append((src, kernel_ini(src)))
+    if not jobs:
+        ap.error("no kernels")
+
+    results, total = compile_batch(jobs, args.outdir, args.jobs)
+    s = summary(results, total)
+    write_text(os.path.join(args.outdir, "summary.txt"), s)
+    print (s, end="")
+    if [r for r in results if not r["ok"]]:
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,645 @@
+# -------------------------------------------------------------------------------
+# bench.py
+#
+# Benchmarks for pipeline synthesis tool
+# run: python bench.py [pipeline | timing | csd | branches | equiv | threads | verilog | variants | checkpoint | suite [kernel ...] | gen kernel size [dir]]
+#
+# Copyright (C) 2017, Andrej Trost
+# License: MIT
+# -------------------------------------------------------------------------------
+from __future__ import print_function
+import ast
+import math
+import os
+import sys
+import tempfile
+import time
+from par import Par
+from astpar import AstPar
+from pyprog import Writer, Var, Num, Op, Assign
+
+clock = getattr(time, "perf_counter", time.time)
+
+
+def fm_kernel(n):  # unrolled FM-style kernel with n blocks (5 lines per block)
+    s = "def K(a, b, f1, f2, gain, sel):\n"
+    for i in range(n):
+        s += "    add%d = a + b\n" % i
+        s += "    sub%d = a - b\n" % i
+        s += "    if sel:\n"
+        s += "        m%d = (add%d*461 + ((sub%d*f2) >> 16)*461 + f1*102) >> 10\n" % (i, i, i)
+        s += "    z%d = m%d * gain >> 8\n" % (i, i)
+    s += "    return z%d\n" % (n-1)
+    return s
+
+
+def chain_kernel(n, depth=8):  # n assignments in dependent chains of given depth
+    s = "def C(a, b, gain):\n"
+    for i in range(n):
+        if i % depth:
+            s += "    x%d = x%d * gain + a\n" % (i, i-1)
+        else:
+            s += "    x%d = a + b\n" % i
+    s += "    return x%d\n" % (n-1)
+    return s
+
+
+def fir_kernel(n):  # n-tap FIR sum of products, transposed form (taps alternate stream inputs a, b)
+    s = "def F(a, b, gain):\n"
+    s += "    y0 = a * %d\n" % (n*7 % 509 + 3)
+    for i in range(1, n):
+        s += "    y%d = y%d + %s * %d\n" % (i, i-1, "ab"[i % 2], (i*37 + n*7) % 509 + 3)
+    s += "    z = y%d * gain >> 8\n" % (n-1)
+    s += "    return z\n"
+    return s
+
+
+def adder_kernel(n):  # adder chain of depth n
+    s = "def A(a, b):\n"
+    s += "    x0 = a + b\n"
+    for i in range(1, n):
+        s += "    x%d = x%d %s %s\n" % (i, i-1, "+-"[i % 2], "ab"[i % 2])
+    s += "    return x%d\n" % (n-1)
+    return s
+
+
+def cond_kernel(n):  # conditional block with n assignments in each branch
+    s = "def W(a, b, gain, sel):\n"
+    s += "    if sel:\n"
+    for i in range(n):
+        s += "        x%d = a * %d + b\n" % (i, i+3)
+    s += "    else:\n"
+    for i in range(n):
+        s += "        x%d = a - b * %d\n" % (i, i+5)
+    s += "    z = x%d * gain >> 8\n" % (n-1)
+    s += "    return z\n"
+    return s
+
+
+# kernel generators: name -> (source generator, ini inputs, ini outputs, sizes)
+kernels = {
+    "fir": (fir_kernel, [("a", "in0_stream", 14), ("b", "in1_stream", 14), ("gain", "reg", 8)],
+            [("z", "out0_stream", 14)], (16, 64, 256, 1024)),
+    "adder": (adder_kernel, [("a", "in0_stream", 14), ("b", "in1_stream", 14)],
+              [("x%d", "out0_stream", 14)], (16, 64, 256, 1024)),
+    "cond": (cond_kernel, [("a", "in0_stream", 14), ("b", "in1_stream", 14), ("gain", "reg", 8), ("sel", "reg", 1)],
+             [("z", "out0_stream", 14)], (16, 64, 256, 1024)),
+    "fm": (fm_kernel, [("a", "in0_stream", 14), ("b", "in1_stream", 14), ("f1", "in2_stream", 14),
+                       ("f2", "in3_stream", 14), ("gain", "reg", 8), ("sel", "reg", 1)],
+           [("z%d", "out0_stream", 14)], (4, 16, 64, 256)),
+}
+
+
+def write_kernel(d, name, n):  # write kernel source and ini file to directory d, return file names
+    (gen, inputs, outputs, sizes) = kernels[name]
+    fname = os.path.join(d, "%s%d.py" % (name, n))
+    cname = os.path.join(d, "%s%d.ini" % (name, n))
+    f = open(fname, 'w')
+    f.write(gen(n))
+    f.close()
+    f = open(cname, 'w')
+    f.write(ini(inputs, [(o.replace("%d", str(n-1)), interface, size) for (o, interface, size) in outputs]))
+    f.close()
+    return fname, cname
+
+
+def ini(inputs, outputs):  # configuration text, inputs and outputs: list of (name, interface, size)
+    s = "[inputs]\n"
+    for (name, interface, size) in inputs:
+        s += "%s = %s, %d\n" % (name, interface, size)
+    s += "\n[outputs]\n"
+    for (name, interface, size) in outputs:
+        s += "%s = %s, %d\n" % (name, interface, size)
+    return s
+
+
+def quiet(fn, *args):  # call fn with stdout suppressed, return (result, time)
+    stdout = sys.stdout
+    sys.stdout = open(os.devnull, 'w')
+    try:
+        t0 = clock()
+        r = fn(*args)
+        t = clock() - t0
+    finally:
+        sys.stdout.close()
+        sys.stdout = stdout
+    return r, t
+
+
+def bench_parse(sizes=(10, 100, 1000), repeat=3):  # Par.compile vs. AstPar.compile (lines/s)
+    # ast.parse: Python parser alone, upper bound of AstPar (lowering to pyprog adds about a third)
+    print ("Parser throughput (lines/s):")
+    print ("%8s %12s %12s %12s %8s" % ("lines", "Par", "AstPar", "ast.parse", "speedup"))
+    d = tempfile.mkdtemp()
+    for n in sizes:
+        src = fm_kernel(n)
+        fname = os.path.join(d, "k%d.py" % n)
+        f = open(fname, 'w')
+        f.write(src)
+        f.close()
+        lines = src.count("\n")
+
+        tp = min(quiet(lambda: Par().compile(fname))[1] for i in range(repeat))
+        ta = min(quiet(lambda: AstPar().compile(fname))[1] for i in range(repeat))
+        tt = min(quiet(lambda: ast.parse(src))[1] for i in range(repeat))
+        print ("%8d %12.0f %12.0f %12.0f %8.1f" % (lines, lines/tp, lines/ta, lines/tt, tp/ta))
+        os.remove(fname)
+    os.rmdir(d)
+
+
+def bench_pipeline(sizes=(1250, 2500, 5000, 10000), repeat=3, limit=3.0):  # analyze + pipe_transform scaling, True if linear
+    from PyPipeSynth import Transf
+    from config import Conf
+    print ("Pipeline transform scaling:")
+    print ("%8s %10s %12s" % ("assign", "time (s)", "us/assign"))
+    d = tempfile.mkdtemp()
+    fname = os.path.join(d, "chain.py")
+    cname = os.path.join(d, "chain.ini")
+    f = open(cname, 'w')
+    f.write(ini([("a", "in0_stream", 14), ("b", "in1_stream", 14), ("gain", "reg", 8)], []))
+    f.close()
+    c = Conf(cname)
+    last = None
+    ok = True
+    for n in sizes:
+        f = open(fname, 'w')
+        f.write(chain_kernel(n))
+        f.close()
+        tt = None
+        for i in range(repeat):
+            t = Transf(quiet(lambda: AstPar().compile(fname))[0], c)
+            ti = quiet(lambda: (t.analyze(), t.pipe_transform()))[1]
+            if tt is None or ti < tt:
+                tt = ti
+        print ("%8d %10.3f %12.1f" % (n, tt, 1e6*tt/n))
+        if last is not None and tt/last > limit:  # doubling the kernel should roughly double the time
+            print ("Error: superlinear scaling from %d to %d assignments (%.1fx time)" % (n//2, n, tt/last))
+            ok = False
+        last = tt
+    os.remove(fname)
+    os.remove(cname)
+    os.rmdir(d)
+    return ok
+
+
+def measure(fn):  # return (time, peak traced memory in bytes) of fn()
+    try:
+        import tracemalloc
+    except ImportError:  # Python 2: time only
+        return quiet(fn)[1], 0
+    tracemalloc.start()
+    t = quiet(fn)[1]
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return t, peak
+
+
+def fm_transf(n):  # parsed, analyzed and transformed FM-style kernel, ready to wrap
+    from PyPipeSynth import Transf
+    from config import Conf
+    d = tempfile.mkdtemp()
+    fname = os.path.join(d, "fm.py")
+    cname = os.path.join(d, "fm.ini")
+    f = open(fname, 'w')
+    f.write(fm_kernel(n))
+    f.close()
+    f = open(cname, 'w')
+    f.write(ini([("a", "in0_stream", 14), ("b", "in1_stream", 14), ("f1", "in2_stream", 14),
+                 ("f2", "in3_stream", 14), ("gain", "reg", 8), ("sel", "reg", 1)],
+                [("z%d" % (n-1), "out0_stream", 14)]))
+    f.close()
+    t = Transf(quiet(lambda: AstPar().compile(fname))[0], Conf(cname))
+    quiet(lambda: (t.analyze(), t.pipe_transform()))
+    os.remove(fname)
+    os.remove(cname)
+    os.rmdir(d)
+    return t
+
+
+def bench_emit(sizes=(100, 1000, 4000)):  # MyHDL output: whole string vs. streaming to file
+    print ("MyHDL emission, string then write vs. streaming write_wrapper:")
+    print ("%8s %10s %12s %10s %12s" % ("blocks", "str (s)", "str peak kB", "stream (s)", "stream peak kB"))
+    for n in sizes:
+        t = fm_transf(n)
+        quiet(t.build_wrapper)
+        fname = os.path.join(tempfile.gettempdir(), "proc_bench.py")
+
+        def string():
+            w = Writer()
+            t.write_wrapper(w)
+            f = open(fname, 'w')
+            f.write(w.getvalue())
+            f.close()
+
+        def stream():
+            f = open(fname, 'w')
+            t.write_wrapper(f)
+            f.close()
+
+        ts, ps = measure(string)
+        tw, pw = measure(stream)
+        print ("%8d %10.3f %12.0f %10.3f %12.0f" % (n, ts, ps/1024.0, tw, pw/1024.0))
+        os.remove(fname)
+
+
+def node_size(fn, n=100000):  # traced memory per object created by fn()
+    try:
+        import tracemalloc
+    except ImportError:
+        return 0
+    tracemalloc.start()
+    objs = [fn() for i in range(n)]
+    size = tracemalloc.get_traced_memory()[0] - sys.getsizeof(objs)
+    tracemalloc.stop()
+    return size / float(n)
+
+
+def bench_ir(n=2000, repeat=3):  # IR memory per node and parse + transform + wrap time
+    v = Var("x")
+    print ("IR memory per node (bytes):")
+    print (" Var: %.0f, Num: %.0f, Op: %.0f, Assign: %.0f" % (
+        node_size(lambda: Var("v")), node_size(lambda: Num("461")),
+        node_size(lambda: Op(v, '+', v)), node_size(lambda: Assign(v))))
+
+    tt = min(quiet(lambda: fm_transf(n).wrap())[1] for i in range(repeat))
+    print ("FM kernel, %d blocks: parse + transform + wrap %.3f s" % (n, tt))
+
+
+def bench_verilog(sizes=(16, 64, 256, 1024), repeat=3):  # Verilog: MyHDL wrapper + toVerilog vs. direct backend
+    import subprocess
+    from verilog import write_verilog
+    try:
+        import myhdl
+    except ImportError:
+        myhdl = None
+    print ("Verilog generation, MyHDL (write proc.py, run toVerilog) vs. direct write_verilog:")
+    if myhdl is None:
+        print (" myhdl is not installed, MyHDL conversion is not timed")
+    print ("%8s %12s %14s %12s %8s" % ("blocks", "proc.py (s)", "toVerilog (s)", "direct (s)", "speedup"))
+    d = tempfile.mkdtemp()
+    for n in sizes:
+        t = fm_transf(n)
+        quiet(t.build_wrapper)
+        tw = min(quiet(lambda: t.write_wrapper(Writer()))[1] for i in range(repeat))
+        tv = min(quiet(lambda: write_verilog(t, Writer()))[1] for i in range(repeat))
+        s = "%8d %12.4f" % (n, tw)
+        if myhdl is not None:
+            f = open(os.path.join(d, "proc.py"), 'w')
+            t.write_wrapper(f)
+            f.close()
+            t0 = clock()
+            subprocess.call([sys.executable, "proc.py"], cwd=d, stdout=open(os.devnull, 'w'), stderr=subprocess.STDOUT)
+            tc = clock() - t0
+            s += " %14.3f %12.4f %8.0f" % (tc, tv, (tw+tc)/tv)
+        else:
+            s += " %14s %12.4f %8s" % ("-", tv, "-")
+        print (s)
+    for x in os.listdir(d):
+        os.remove(os.path.join(d, x))
+    os.rmdir(d)
+
+
+def checked(src, c, stats):  # synthesize src with Conf c and fill stats, return errors of simulation against src
+    from PyPipeSynth import Transf, synthesize
+    from sim import equivalent
+    t = Transf(AstPar(Writer()).parse(src, "k"), c, None, Writer())
+    synthesize(t, None, None, "k", None, None, stats)
+    return equivalent(t, src)
+
+
+def bench_timing(clocks=(None, 100, 125, 200, 250)):  # timing-driven pipeline: latency, Fmax and resources, True if correct
+    # map: number of multiply-add groups mapped to DSP slices
+    from PyPipeSynth import read_text
+    from config import Conf
+    (gen, inputs, outputs, sizes) = kernels["fir"]
+    n = 16
+    outs = [(o.replace("%d", str(n-1)), interface, size) for (o, interface, size) in outputs]
+    work = [("test.py", read_text(os.path.join("work", "test.py")), read_text(os.path.join("work", "rp.ini"))),
+            ("fir16", gen(n), ini(inputs, outs))]
+    print ("Timing-driven pipeline (target clock, estimated Fmax):")
+    print ("%-10s %8s %4s %8s %10s %6s %6s %4s" % ("kernel", "clock", "map", "latency", "Fmax", "LUT", "FF", "DSP"))
+    bad = 0
+    for (name, src, initext) in work:
+        for mhz in clocks:
+            for dsp in [False, True][:1 + (mhz is not None)]:   # multiply-add DSP mapping
+                c = Conf(text=initext)
+                c.clock = mhz
+                c.dsp = dsp
+                stats = {}
+                errors = checked(src, c, stats)
+                if errors:      # no numbers of a wrong pipeline
+                    print ("%-10s %8s %4s  error: %s" % (name, mhz or "-", "dsp" if dsp else "-", "; ".join(errors)))
+                    bad += 1
+                    continue
+                print ("%-10s %8s %4s %8d %10.1f %6d %6d %4d" % (name, mhz or "-", stats["dsp_groups"] or "-",
+                       stats["latency"], stats["fmax"], stats["luts"], stats["ffs"], stats["dsps"]))
+    return bad == 0
+
+
+def bench_csd(clocks=(None, 125)):  # constant multipliers: DSP multiply vs. CSD shift-add networks, True if correct
+    from PyPipeSynth import read_text
+    from config import Conf
+    work = [("test.py", read_text(os.path.join("work", "test.py")), read_text(os.path.join("work", "rp.ini")))]
+    for (name, n) in [("fir", 16), ("cond", 16)]:
+        (gen, inputs, outputs, sizes) = kernels[name]
+        outs = [(o.replace("%d", str(n-1)), interface, size) for (o, interface, size) in outputs]
+        work.append((name + str(n), gen(n), ini(inputs, outs)))
+    print ("Constant multipliers (csd: shift-add where cheaper than DSP):")
+    print ("%-10s %8s %4s %8s %10s %6s %6s %4s %6s" % ("kernel", "clock", "csd", "latency", "Fmax", "LUT", "FF", "DSP", "saved"))
+    bad = 0
+    for (name, src, initext) in work:
+        for mhz in clocks:
+            for on in [False, True]:
+                c = Conf(text=initext)
+                c.clock = mhz
+                c.csd = on
+                stats = {}
+                errors = checked(src, c, stats)
+                if errors:
+                    print ("%-10s %8s %4s  error: %s" % (name, mhz or "-", "yes" if on else "no", "; ".join(errors)))
+                    bad += 1
+                    continue
+                print ("%-10s %8s %4s %8d %10.1f %6d %6d %4d %6d" % (name, mhz or "-", "yes" if on else "no",
+                       stats["latency"], stats["fmax"], stats["luts"], stats["ffs"], stats["dsps"], stats["dsp_saved"]))
+    return bad == 0
+
+
+branch_sources = [  # conditional assignments split over pipeline stages (if statements of conditions_body)
+    "def C(a, b, sel):\n    if sel:\n        x = a * b\n        y = a + b\n"
+    "    else:\n        x = a - b\n        y = (a * b) * a\n    return x, y\n",     # else after true body
+    "def C(a, b, sel):\n    x = a + b\n    y = a - b\n    if sel:\n        x = (a * b) * a\n"
+    "    else:\n        y = a * b\n    return x, y\n",                            # else body first, defaults
+    "def C(a, b, sel):\n    x = a + b\n    y = a - b\n    if sel:\n        x = (a * b) * a\n"
+    "    else:\n        y = a * b\n    if sel:\n        y = b\n    return x, y\n",  # two if statements
+    "def C(a, b, sel):\n    v1q = a + b\n    v2q = 16*((b*100)+100)\n    if sel:\n        v2q = (100*v1q) >> 3\n"
+    "    x = a + v1q\n    y = v2q\n    return x, y\n"]                     # folded constant in both branches
+
+
+branch_ini = ini([("a", "in0_stream", 14), ("b", "in1_stream", 14), ("sel", "reg", 1)],
+                 [("x", "out0_stream", 14), ("y", "out1_stream", 14)])
+
+
+def branch_errors(body, errors, cond=None):  # conditional assignments in wrong branch or before default value
+    for st in body.stlist:
+        if isinstance(st, Assign):
+            if st.target in cond:
+                errors.append("default after conditional: " + st.code(0).strip())
+        else:
+            for (b, branch) in [(st.body, True), (st.elsbody, False)]:
+                if b is None:
+                    continue
+                for a in b.stlist:
+                    if (st.cond, branch) not in a.clist:
+                        errors.append("wrong branch: " + a.code(0).strip())
+                    cond.add(a.target)
+    return errors
+
+
+def bench_branches(clocks=(None, 100, 200, 300)):  # if statements of conditional assignments after pipelining
+    from PyPipeSynth import Transf
+    from config import Conf
+    from sim import Sim
+    bad = 0
+    for i in range(len(branch_sources)):
+        for mhz in clocks:
+            c = Conf(text=branch_ini)
+            c.clock = mhz
+            t = Transf(AstPar(Writer()).parse(branch_sources[i], "k"), c, None, Writer())
+            t.analyze()
+            t.pipe_transform()
+            errors = branch_errors(t.fn.body, [], set())
+            t.wrap()
+            errors += Sim(t).errors
+            print ("Branches %d %8s: %s" % (i, mhz or "-", "; ".join(errors) or "ok"))
+            bad += len(errors)
+    return bad == 0
+
+
+equiv_sources = [  # clocked pipelines: temporaries and registers named as variables, wires of outputs, DSP
+    "def C(a, b, sel):\n    y1 = a*3 + b*5\n    y = y1 + a\n    x = a\n    return x, y\n",
+    "def C(a, b, sel):\n    x_z1 = a + b\n    x = x_z1 * a\n    y = x_z1\n    return x, y\n",
+    "def C(a, b, sel):\n    x = (sel+b)+(a*b)\n    y = x\n    return x, y\n",
+    "def C(a, b, sel):\n    v = (a - b) * (b - 1)\n    if sel:\n        v = a * 300\n"   # conditional multiply
+    "    x = v * 3 + a\n    y = (a + b) * v\n    return x, y\n"]
+
+
+def bench_equiv(clocks=(None, 80, 125, 200, 300)):  # simulated pipelines equal the source functions, True if all equal
+    from PyPipeSynth import Transf
+    from config import Conf
+    from sim import equivalent
+    work = []
+    for (name, n) in [("fm", 2), ("fir", 16), ("adder", 8), ("cond", 4)]:
+        (gen, inputs, outputs, sizes) = kernels[name]
+        outs = [(o.replace("%d", str(n-1)), interface, size) for (o, interface, size) in outputs]
+        work.append((name + str(n), gen(n), ini(inputs, outs)))
+    for (i, src) in enumerate(branch_sources + equiv_sources):
+        work.append(("source" + str(i), src, branch_ini))
+    bad = 0
+    for (name, src, initext) in work:
+        for mhz in clocks:
+            for dsp in [False, True][:1 + (mhz is not None)]:   # multiply-add DSP mapping
+                for csd in [False, True]:
+                    c = Conf(text=initext)
+                    c.clock = mhz
+                    c.dsp = dsp
+                    c.csd = csd
+                    t = Transf(AstPar(Writer()).parse(src, "k"), c, None, Writer())
+                    t.analyze()
+                    t.pipe_transform()
+                    t.wrap()
+                    errors = equivalent(t, src)
+                    print ("Equivalence %-8s %4s %4s %4s: %s" % (name, mhz or "-", "dsp" if dsp else "-",
+                           "csd" if csd else "-", "; ".join(errors) or "ok"))
+                    bad += len(errors)
+    return bad == 0
+
+
+def bench_threads(threads=8, rounds=4):  # reentrancy stress: concurrent compiles in threads equal sequential ones
+    from multiprocessing.pool import ThreadPool
+    from PyPipeSynth import synthesize
+    from pyprog import SynthError
+    jobs = []
+    for name in ["fir", "adder", "cond", "fm"]:
+        (gen, inputs, outputs, sizes) = kernels[name]
+        for n in sizes[:3]:
+            outs = [(o.replace("%d", str(n-1)), interface, size) for (o, interface, size) in outputs]
+            jobs.append((gen(n), ini(inputs, outs)))
+    jobs.append(("def F(a, b):\n    x = a +\n", jobs[0][1]))     # parse error
+    jobs.append(("def G(a, b):\n    x = a\n    x = b\n    return x\n", jobs[0][1]))  # analysis error
+
+    def run(job):
+        (src, initext) = job
+        try:
+            p = Par(Writer()).parse(src, "k").code()    # both parsers
+        except SynthError as e:
+            p = str(e)
+        try:
+            return p, synthesize(src, initext)
+        except SynthError as e:
+            return p, str(e)
+
+    expect = [run(job) for job in jobs]
+    pool = ThreadPool(threads)
+    t0 = clock()
+    results = pool.map(run, jobs * rounds, 1)
+    t = clock() - t0
+    pool.close()
+    pool.join()
+    bad = len([i for i in range(len(results)) if results[i] != expect[i % len(jobs)]])
+    print ("Thread stress: %d compiles in %d threads, %.3f s, %d differ from sequential" % (
+        len(results), threads, t, bad))
+    return bad == 0
+
+
+def bench_variants(n=64, widths=(8, 10, 12, 14, 16), repeat=3):  # configuration variants: parse each vs. parse once
+    from PyPipeSynth import synthesize, synthesize_variants, template_file
+    src = fm_kernel(n)
+    f = open(template_file)
+    tmpl = f.read()
+    f.close()
+    configs = []
+    for w in widths:
+        for fi in ["stream", "reg"]:  # f1, f2 stream inputs or registers
+            configs.append(ini([("a", "in0_stream", w), ("b", "in1_stream", w),
+                                ("f1", "in2_stream" if fi == "stream" else "reg", w),
+                                ("f2", "in3_stream" if fi == "stream" else "reg", w),
+                                ("gain", "reg", 8), ("sel", "reg", 1)], [("z%d" % (n-1), "out0_stream", w)]))
+    print ("FM kernel, %d blocks, %d configuration variants:" % (n, len(configs)))
+    tr, r0 = None, None
+    for i in range(repeat):
+        (r, t) = quiet(lambda: [synthesize(src, c, tmpl) for c in configs])
+        if tr is None or t < tr:
+            tr, r0 = t, r
+    to = min(quiet(synthesize_variants, src, configs, tmpl)[1] for i in range(repeat))
+    tt = min(quiet(synthesize_variants, src, configs, tmpl, "test", 4)[1] for i in range(repeat))
+    print (" parse per variant %.3f s, parse once %.3f s, 4 threads %.3f s" % (tr, to, tt))
+
+    p = quiet(lambda: AstPar().parse(src, "test"))[0]
+    e = p.emit()
+    r1 = quiet(synthesize_variants, p, configs, tmpl, "test", 4)[0]
+    print (" outputs equal: %s, parsed program unchanged: %s" % (r0 == r1, p.emit() == e))
+
+
+def bench_checkpoint(kernels_sizes=(("fm", 256), ("adder", 1024)), repeat=3):  # checkpoint round trip and load time, True if equal
+    from PyPipeSynth import synthesize, resume
+    from prof import Profiler
+    import checkpoint
+    derive = [("parse", ["parse"]), ("analyze", ["parse", "config", "analyze"]),
+              ("transform", ["parse", "config", "analyze", "pipe_transform"]),
+              ("wrapper", ["parse", "config", "analyze", "pipe_transform", "build_wrapper"])]
+    d = tempfile.mkdtemp()
+    bad = 0
+    for (name, n) in kernels_sizes:
+        fname, cname = write_kernel(d, name, n)
+        src = open(fname).read()
+        initext = open(cname).read()
+        kname = "%s%d" % (name, n)
+        prof = Profiler(memory=False)
+        out = synthesize(src, initext, None, kname, None, prof, None, d)
+        times = dict([(rec["name"], rec["time_s"]) for rec in prof.phases])
+        print ("Checkpoints %s:" % kname)
+        print ("%10s %10s %12s %10s %8s %6s" % ("phase", "size kB", "derive (s)", "load (s)", "speedup", "equal"))
+        for (phase, names) in derive:
+            ck = checkpoint.filename(d, kname, phase)
+            tl = min(quiet(checkpoint.load, ck)[1] for i in range(repeat))
+            td = sum([times[x] for x in names])
+            r = resume(ck, initext)
+            print ("%10s %10.1f %12.4f %10.4f %8.1f %6s" % (phase, os.path.getsize(ck)/1024.0, td, tl, td/tl, r == out))
+            bad += r != out
+            os.remove(ck)
+        os.remove(fname)
+        os.remove(cname)
+    os.rmdir(d)
+    return bad == 0
+
+
+phases = ["parse", "analyze", "pipe_transform", "wrap"]
+
+
+def compile_phases(fname, cname):  # run all phases on kernel, return {phase: time}
+    from PyPipeSynth import Transf
+    from config import Conf
+    from prof import Profiler
+    prof = Profiler(memory=False)
+    with prof.phase("parse"):
+        p = AstPar().compile(fname)
+    t = Transf(p, Conf(cname))
+    with prof.phase("analyze"):
+        t.analyze()
+    with prof.phase("pipe_transform"):
+        t.pipe_transform()
+    with prof.phase("wrap"):
+        t.wrap()
+    return dict([(rec["name"], rec["time_s"]) for rec in prof.phases])
+
+
+def bench_suite(names=("fir", "adder", "cond", "fm"), repeat=3, limit=1.5):  # phase times and scaling curves
+    d = tempfile.mkdtemp()
+    for name in names:
+        print ("Kernel %s:" % name)
+        print ("%8s %8s" % ("size", "lines") + "".join(["%15s" % ph for ph in phases]) + "%10s %8s" % ("total", "exp"))
+        last = None
+        for n in kernels[name][3]:
+            fname, cname = write_kernel(d, name, n)
+            f = open(fname)
+            lines = len(f.readlines())
+            f.close()
+            tt = None
+            for i in range(repeat):
+                ti = quiet(compile_phases, fname, cname)[0]
+                if tt is None or sum(ti.values()) < sum(tt.values()):
+                    tt = ti
+            total = sum(tt.values())
+            s = "%8d %8d" % (n, lines) + "".join(["%15.4f" % tt[ph] for ph in phases]) + "%10.4f" % total
+            if last is not None:  # scaling exponent: time ~ lines^exp
+                exp = math.log(total/last[1]) / math.log(float(lines)/last[0])
+                s += " %8.2f" % exp
+                if exp > limit:
+                    s += "  superlinear"
+            print (s)
+            last = (lines, total)
+            os.remove(fname)
+            os.remove(cname)
+    os.rmdir(d)
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1 and sys.argv[1] == "gen":  # python bench.py gen <kernel> <size> [dir]
+        d = "."
+        if len(sys.argv) > 4:
+            d = sys.argv[4]
+        print (" ".join(write_kernel(d, sys.argv[2], int(sys.argv[3]))))
+    elif len(sys.argv) > 1 and sys.argv[1] == "pipeline":
+        sys.exit(not bench_pipeline())
+    elif len(sys.argv) > 1 and sys.argv[1] == "timing":
+        sys.exit(not bench_timing())
+    elif len(sys.argv) > 1 and sys.argv[1] == "csd":
+        sys.exit(not bench_csd())
+    elif len(sys.argv) > 1 and sys.argv[1] == "branches":
+        sys.exit(not bench_branches())
+    elif len(sys.argv) > 1 and sys.argv[1] == "equiv":
+        sys.exit(not bench_equiv())
+    elif len(sys.argv) > 1 and sys.argv[1] == "threads":
+        sys.exit(not bench_threads())
+    elif len(sys.argv) > 1 and sys.argv[1] == "verilog":
+        bench_verilog()
+    elif len(sys.argv) > 1 and sys.argv[1] == "variants":
+        bench_variants()
+    elif len(sys.argv) > 1 and sys.argv[1] == "checkpoint":
+        sys.exit(not bench_checkpoint())
+    elif len(sys.argv) > 1 and sys.argv[1] == "suite":
+        bench_suite(sys.argv[2:] or kernels.keys())
+    else:
+        bench_parse()
+        bench_pipeline()
+        bench_emit()
+        bench_ir()
+        bench_verilog()
+        bench_timing()
+        bench_csd()
+        bench_branches()
+        bench_equiv()
+        bench_threads()
+        bench_variants()
+        bench_checkpoint()
+        bench_suite()
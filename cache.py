@@ -0,0 +1,114 @@
+# -------------------------------------------------------------------------------
+# cache.py
+#
+# Content-addressed cache for pipeline synthesis tool outputs
+# Key: hash of function source, ini file, interface template and tool version
+# Store: directory per key with output files, size bounded, LRU eviction
+#
+# Copyright (C) 2017, Andrej Trost
+# License: MIT
+# -------------------------------------------------------------------------------
+import hashlib
+import os
+import shutil
+import tempfile
+
+version = "0.3"     # tool version, part of cache key
+
+
+def tool_modules():  # source files of the tool: all *.py files of its directory, sorted
+    d = os.path.dirname(os.path.abspath(__file__))
+    return sorted([os.path.join(d, name) for name in os.listdir(d) if name.endswith(".py")])
+
+
+def tool_version():  # version string with hash of tool sources (edits to the tool invalidate the cache)
+    h = hashlib.sha1()
+    for fname in tool_modules():
+        f = open(fname, 'rb')
+        h.update(os.path.basename(fname).encode("utf-8") + b"\0")
+        h.update(f.read())
+        f.close()
+    return version + "-" + h.hexdigest()[:12]
+
+
+def text_key(*parts):  # hash of text parts (length prefixed, so parts cannot run together)
+    h = hashlib.sha256()
+    for s in parts:
+        if not isinstance(s, bytes):
+            s = s.encode("utf-8")
+        h.update(str(len(s)).encode("ascii") + b":")
+        h.update(s)
+    return h.hexdigest()
+
+
+def read_text(fname):
+    f = open(fname, 'r')
+    s = f.read()
+    f.close()
+    return s
+
+
+class Cache:
+
+    def __init__(self, dir, max_size=64*1024*1024):
+        self.dir = dir              # store directory, one subdirectory per key
+        self.max_size = max_size    # bytes of stored outputs
+        if not os.path.isdir(dir):
+            os.makedirs(dir)
+
+    def key(self, src, ini, template, ver=None):  # cache key of synthesis inputs
+        if ver is None:
+            ver = tool_version()
+        return text_key(src, ini, template, ver)
+
+    def get(self, key):  # return {file name: text} of stored outputs or None
+        d = os.path.join(self.dir, key)
+        if not os.path.isdir(d):
+            return None
+        out = {}
+        try:
+            for name in os.listdir(d):
+                out[name] = read_text(os.path.join(d, name))
+            os.utime(d, None)   # mark as recently used
+        except (IOError, OSError):  # evicted meanwhile
+            return None
+        return out
+
+    def put(self, key, out):  # store outputs {file name: text} under key
+        d = os.path.join(self.dir, key)
+        if os.path.isdir(d):
+            return
+        tmp = tempfile.mkdtemp(dir=self.dir, prefix=".tmp")
+        os.chmod(tmp, 0o755)
+        for name in out:
+            f = open(os.path.join(tmp, name), 'w')
+            f.write(out[name])
+            f.close()
+        try:
+            os.rename(tmp, d)   # complete entries only
+        except OSError:         # stored by another process
+            shutil.rmtree(tmp, True)
+        self.evict()
+
+    def entries(self):  # list of (last use, size, path), oldest first
+        lst = []
+        for key in os.listdir(self.dir):
+            d = os.path.join(self.dir, key)
+            if key.startswith(".") or not os.path.isdir(d):
+                continue
+            try:
+                size = sum([os.path.getsize(os.path.join(d, name)) for name in os.listdir(d)])
+                lst.append((os.path.getmtime(d), size, d))
+            except OSError:
+                pass
+        lst.sort()
+        return lst
+
+    def evict(self):  # remove least recently used entries until store fits max_size
+        lst = self.entries()
+        total = sum([size for (t, size, d) in lst])
+        for (t, size, d) in lst:
+            if total <= self.max_size:
+                break
+            shutil.rmtree(d, True)
+            total -= size
@@ -0,0 +1,49 @@
+# -------------------------------------------------------------------------------
+# checkpoint.py
+#
+# IR checkpoints for pipeline synthesis tool: program after parse, Transf after
+# analyze, pipe_transform and build_wrapper, saved as pickle with a header
+# File: <name>.<phase>.ckpt: magic, tool version line, pickle of (name, phase, IR),
+# the version is checked before unpickling, resume with PyPipeSynth.resume()
+#
+# Copyright (C) 2017, Andrej Trost
+# License: MIT
+# -------------------------------------------------------------------------------
+import os
+import pickle
+import sys
+from cache import tool_version
+
+magic = b"PPSCKPT2\n"
+phases = ["parse", "analyze", "transform", "wrapper"]
+sys.setrecursionlimit(max(sys.getrecursionlimit(), 10000))  # pickle of deep expression trees (once, all threads)
+
+
+def filename(d, name, phase):
+    return os.path.join(d, name + "." + phase + ".ckpt")
+
+
+def save(d, name, phase, x):  # save program (parse) or Transf to checkpoint file, return file name
+    fname = filename(d, name, phase)
+    f = open(fname, 'wb')
+    try:
+        f.write(magic)
+        f.write(tool_version().encode("ascii") + b"\n")
+        pickle.dump((name, phase, x), f, pickle.HIGHEST_PROTOCOL)
+    finally:
+        f.close()
+    return fname
+
+
+def load(fname):  # return (name, phase, program or Transf) of checkpoint file
+    f = open(fname, 'rb')
+    try:
+        if f.read(len(magic)) != magic:
+            raise ValueError("checkpoint: " + fname + " is not a checkpoint file")
+        ver = f.readline().rstrip(b"\n").decode("ascii", "replace")
+        if ver != tool_version():   # IR classes of other version may not unpickle
+            raise ValueError("checkpoint: " + fname + " was saved by tool version " + ver)
+        (name, phase, x) = pickle.load(f)
+    finally:
+        f.close()
+    return name, phase, x
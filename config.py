@@ -6,13 +6,25 @@
 # Copyright (C) 2017, Andrej Trost
 # License: MIT
 # -------------------------------------------------------------------------------
-import ConfigParser
+from __future__ import print_function
+try:
+    import ConfigParser
+    from StringIO import StringIO
+except ImportError:  # Python 3
+    import configparser as ConfigParser
+    from io import StringIO
 
 
 class Conf:
-    def __init__(self, name):
+    def __init__(self, name=None, text=None, log=None):  # read file name or ini text
         self.config = ConfigParser.ConfigParser()
-        self.config.read(name)
+        if text is not None:
+            if hasattr(self.config, "read_string"):
+                self.config.read_string(text)
+            else:
+                self.config.readfp(StringIO(text))
+        else:
+            self.config.read(name)
 
         self.inputs = []
         self.insize = []
@@ -31,7 +43,7 @@ class Conf:
                 else:
                     self.insize.append(14)    # default size
         except ConfigParser.Error:
-            print ("No section Inputs in configuration!")
+            print ("No section Inputs in configuration!", file=log)
 
         self.outputs = []
         self.outsize = []
@@ -50,5 +62,23 @@ class Conf:
                 else:
                     self.outsize.append(14)    # default size
         except ConfigParser.Error:
-            print ("No section Outputs in configuration!")
+            print ("No section Outputs in configuration!", file=log)
+
+        self.clock = None   # target clock frequency (MHz) for timing-driven pipeline
+        if self.config.has_option("timing", "clock"):
+            self.clock = float(self.config.get("timing", "clock"))
+        self.dsp = True     # map multiply-add patterns to DSP slices (timing-driven pipeline)
+        if self.config.has_option("timing", "dsp"):
+            self.dsp = self.config.getboolean("timing", "dsp")
+        self.csd = False    # multiplications by constants to shift-add networks where cheaper than DSP (opt-in)
+        if self.config.has_option("timing", "csd"):
+            self.csd = self.config.getboolean("timing", "csd")
+        self.device = None  # device of operator delay/area model (timing.devices)
+        if self.config.has_option("timing", "device"):
+            self.device = self.config.get("timing", "device").strip()
+
+    def __getstate__(self):  # checkpoint: parsed lists only
+        d = self.__dict__.copy()
+        d["config"] = None
+        return d
 
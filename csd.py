@@ -0,0 +1,120 @@
+# -------------------------------------------------------------------------------
+# csd.py
+#
+# Constant multiplication by shifts and adds for pipeline synthesis tool
+# csd: canonical signed digit (CSD) recoding of a constant, digits -1, 0, 1 with
+#      no two adjacent nonzero digits, the minimal number of nonzero digits
+# mcm: multiple constant multiplication, CSD digit pairs common to the constants
+#      multiplying the same operand are computed once as shared terms (Hartley's
+#      common subexpression elimination)
+# A constant (or term) is a list of parts (sign, shift, base): the sum of
+# sign * (base << shift), base is the index of a term, term 0 is the operand
+#
+# Copyright (C) 2017, Andrej Trost
+# License: MIT
+# -------------------------------------------------------------------------------
+
+
+def csd(c):  # CSD digits of integer c > 0: [(sign, shift)] from LSB
+    digits = []
+    k = 0
+    while c:
+        if c & 1:
+            d = 2 - (c & 3)     # 1 for ...01, -1 for ...11 (carry to next digit)
+            digits.append((d, k))
+            c -= d
+        c >>= 1
+        k += 1
+    return digits
+
+
+def odd(c):  # (odd part, shift) of integer c > 0
+    k = 0
+    while not c & 1:
+        c >>= 1
+        k += 1
+    return c, k
+
+
+def pattern(p, q, values):  # (key, value) of the pair of parts p, q, value > 0 is the normalized term
+    if (p[1], p[2]) > (q[1], q[2]):
+        p, q = q, p
+    r = p[0] * q[0]     # relative sign
+    d = q[1] - p[1]
+    return (p[2], q[2], d, r), values[p[2]] + r * (values[q[2]] << d)
+
+
+def pairs(parts, key, values):  # disjoint pairs of parts matching pattern key: [(p, q)] low shift first
+    used = set()
+    found = []
+    for i in range(len(parts)):
+        for j in range(i+1, len(parts)):
+            if i in used or j in used:
+                continue
+            p, q = parts[i], parts[j]
+            if (p[1], p[2]) > (q[1], q[2]):
+                p, q = q, p
+            if pattern(p, q, values)[0] == key:
+                used.update([i, j])
+                found.append((i, j, p))
+    return found
+
+
+def mcm(consts):
+    """
+Shared shift-add terms of odd constants > 1 multiplying one operand.
+Returns (terms, reps): terms[i] = (value, parts) for i > 0 (term 0 is the
+operand), reps = {constant: parts}. The most frequent pair of parts (same
+bases, distance and relative sign) is replaced by a new term while it
+occurs at least twice, the number of adders is
+sum(len(parts) - 1) over terms and constants.
+    """
+    values = [1]
+    terms = [(1, [])]
+    reps = dict([(c, [(s, k, 0) for (s, k) in csd(c)]) for c in consts])
+    while True:
+        count = {}
+        for c in consts:
+            parts = reps[c]
+            seen = set()
+            for i in range(len(parts)):
+                for j in range(i+1, len(parts)):
+                    (key, v) = pattern(parts[i], parts[j], values)
+                    if v != 0 and key not in seen:
+                        seen.add(key)
+                        count[key] = count.get(key, 0) + len(pairs(parts, key, values))
+        best = None
+        for key in sorted(count):
+            if count[key] >= 2 and (best is None or count[key] > count[best]):
+                best = key
+        if best is None:
+            return terms, reps
+
+        (b1, b2, d, r) = best
+        v = values[b1] + r * (values[b2] << d)
+        s = 1
+        if v < 0:       # terms are positive, sign goes to the parts using it
+            s = -1
+        m = len(terms)
+        values.append(s * v)
+        terms.append((s * v, [(s, 0, b1), (s * r, d, b2)]))
+        for c in consts:
+            parts = reps[c]
+            found = pairs(parts, best, values)
+            if not found:
+                continue
+            drop = set()
+            new = []
+            for (i, j, p) in found:
+                drop.update([i, j])
+                new.append((p[0] * s, p[1], m))
+            reps[c] = [parts[i] for i in range(len(parts)) if i not in drop] + new
+
+
+def adders(terms, reps):  # number of adders of shift-add network
+    n = 0
+    for (v, parts) in terms[1:]:
+        n += len(parts) - 1
+    for parts in reps.values():
+        n += len(parts) - 1
+    return n
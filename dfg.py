@@ -0,0 +1,92 @@
+# -------------------------------------------------------------------------------
+# dfg.py
+#
+# SSA dataflow graph for pipeline synthesis tool
+# Nodes are values (function inputs and assignment targets) with def-use
+# chains and the pipeline stage of the value
+#
+# Copyright (C) 2017, Andrej Trost
+# License: MIT
+# -------------------------------------------------------------------------------
+from pyprog import Signal, Var, Op
+
+
+def expr_vars(op, vlist):  # append variables of expression tree to vlist (left to right)
+    for x in [op.left, op.right]:
+        if isinstance(x, Op):
+            expr_vars(x, vlist)
+        elif isinstance(x, Var):
+            vlist.append(x)
+    return vlist
+
+
+class Node(object):  # dataflow graph value
+    __slots__ = ('var', 'stage', 'stream', 'defs', 'uses', 'regs', 'wire')
+
+    def __init__(self, v):
+        self.var = v            # source variable (input or assignment target before pipelining)
+        self.stage = 0          # pipeline stage of the value
+        self.stream = False     # value is a pipeline stream member (registered)
+        self.defs = []          # defining assignments, conditional assignments share the value
+        self.uses = []          # assignments using the value
+        self.regs = {}          # stage -> register variable holding the value
+        self.wire = None        # signal of a wire value in its stage if not var (output port)
+
+    def reg(self, fn, stage):  # get or create register of the value at stage
+        v = self.regs.get(stage)
+        if v is None:
+            name = self.var.name+"_z"+str(stage)
+            while name in fn.vardict:   # never reuse a variable of the function
+                name += "_"
+            v = fn.get_var(name)
+            v.register = True
+            v.reglevel = stage
+            self.regs[stage] = v
+        return v
+
+
+class Graph(object):  # SSA dataflow graph of function assignments
+    __slots__ = ('nodes', 'current', 'defnode', 'operands')
+
+    def __init__(self, fn, stlist):
+        self.nodes = []         # values in definition (topological) order
+        self.current = {}       # variable name -> current value
+        self.defnode = {}       # assignment -> defined value
+        self.operands = {}      # assignment -> used values (def-use edges)
+
+        for v in fn.vardict.values():
+            if v.mode == Signal.inport:
+                self.node(v)
+        for st in stlist:
+            self.add(st)
+
+    def node(self, v):  # new value of variable v
+        n = Node(v)
+        self.nodes.append(n)
+        self.current[v.name] = n
+        return n
+
+    def add(self, st, used=None):  # add assignment: edges from used values, define target value
+        if used is None:
+            used = []
+            for v in expr_vars(st.oplist[0], []):
+                n = self.current.get(v.name)
+                if n is None:   # undefined variable, treat as input value
+                    n = self.node(v)
+                if n not in used:
+                    used.append(n)
+        for n in used:
+            n.uses.append(st)
+        self.operands[st] = used
+
+        n = self.current.get(st.target.name)
+        if n is None or not n.defs or not st.clist:  # unconditional assignment defines a new value
+            n = self.node(st.target)
+        n.defs.append(st)
+        self.defnode[st] = n
+        return n
+
+    def add_delay(self, st, n):  # add register copy st of value n
+        n.uses.append(st)
+        self.operands[st] = [n]
+        self.defnode[st] = n
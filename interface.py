@@ -6,16 +6,21 @@
 # Copyright (C) 2017, Andrej Trost
 # License: MIT
 # -------------------------------------------------------------------------------
+from __future__ import print_function
 from string import Template
 
 
 class Interface:
 
-    def __init__(self, c):
+    def __init__(self, c, log=None):
         self.c = c  # configuration
+        self.log = log  # file-like for messages (None: stdout)
 
-    def compile(self):
-        filein = open('sigproc.tmp')
+    def compile(self, template=None):  # template text (None: read sigproc.tmp)
+        if template is None:
+            filein = open('sigproc.tmp')
+            template = filein.read()
+            filein.close()
 
         d = {'name': "red_pitaya_sigproc"}
 
@@ -79,8 +84,8 @@ class Interface:
         module += "\n);\n"
         d['module'] = module
 
-        src = Template(filein.read())
+        src = Template(template)
         out = src.substitute(d)
-        print("Interface:\nname adr (size)\n"+stat)
+        print("Interface:\nname adr (size)\n"+stat, file=self.log)
         return out
 
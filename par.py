@@ -8,8 +8,7 @@
 # License: MIT
 # -------------------------------------------------------------------------------
 from __future__ import print_function
-from sys import exit
-from pyprog import *
+from pyprog import Signal, Var, Num, Bool, Op, Condition, Assign, Return, IfElse, Function, PyProg, ParseError
 
 debug = False
 
@@ -42,27 +41,28 @@ class Stack:
 
 
 class Par:
-    name = ""
-    level = 0
 
-    src = " "
-    slen = 1  # used by scan
-    send = False
-    si = 0
-    sline = 1   # line for error report
+    def __init__(self, log=None):
+        self.name = ""
+        self.level = 0
 
-    ident = 0
-    Token = ''
-    TokenStr = ""
-    Look = 'n'
-    LookStr = ""
+        self.src = " "
+        self.slen = 1  # used by scan
+        self.send = False
+        self.si = 0
+        self.sline = 1   # line for error report
 
-    def __init__(self):
-        print ("Parse ", end="")
+        self.ident = 0
+        self.Token = ''
+        self.TokenStr = ""
+        self.Look = 'n'
+        self.LookStr = ""
+
+        self.log = log  # file-like for messages (None: stdout)
+        print ("Parse ", end="", file=self.log)
 
     def error(self, s):
-        print("Line " + str(self.sline) + " Error: " + s)
-        exit()
+        raise ParseError(s, self.sline)
 
     def match(self, s):
         self.scan()
@@ -99,7 +99,7 @@ class Par:
                     self.ident += 1
 
             if debug:
-                print("Newline " + str(self.ident))
+                print("Newline " + str(self.ident), file=self.log)
 
             if not self.si < self.slen - 1:
                 self.send = True
@@ -150,10 +150,10 @@ class Par:
                     op += "="
 
             if op in [">", "<"]:
-                if opn == ">":    # operator >>
+                if opn == op:    # operator >>, <<
                     self.Look = "#"
                     self.si += 2
-                    self.LookStr = ">>"
+                    self.LookStr = op + op
                 else:
                     self.Look = "c"   # comparison op
                     self.LookStr = op
@@ -176,7 +176,7 @@ class Par:
             while self.src[self.si] == ' ' and self.si < self.slen - 1:  # isspace
                 self.si += 1
         if debug:
-            print("Scan : " + self.Token + " Look: " + self.Look)
+            print("Scan : " + self.Token + " Look: " + self.Look, file=self.log)
 
     def comparison(self, block, c):
         s = Stack(c)
@@ -451,19 +451,29 @@ class Par:
         if fname == "":
             return
         else:
-            self.name = fname
+            name = fname
             if fname.endswith(".py"):
-                self.name = fname[:-3]
+                name = fname[:-3]
             f = open(fname, 'r')
-            self.src = f.read() + " \n"
-            print (fname)
+            src = f.read()
+            f.close()
+            print (fname, file=self.log)
             #print(self.src + "---------------------------------")
-            self.slen = len(self.src)
+
+        return self.parse(src, name)
+
+    def parse(self, src, name):  # parse source string, return program
+        self.name = name
+        self.src = src + " \n"
+        self.slen = len(self.src)
 
         prog = PyProg(self.name)
 
         self.scan()
         self.scan()
-        self.compblock(prog)  # compile block of code, outident=-1
+        try:
+            self.compblock(prog)  # compile block of code, outident=-1
+        except IndexError:  # operand stack empty: incomplete expression
+            self.error("Invalid expression")
 
         return prog
@@ -0,0 +1,82 @@
+# -------------------------------------------------------------------------------
+# passes.py
+#
+# Pass manager for pipeline synthesis tool: passes declare the analyses they
+# require, provide and invalidate; required analyses are run on demand and
+# cached until invalidated, pass run times are recorded
+#
+# Copyright (C) 2017, Andrej Trost
+# License: MIT
+# -------------------------------------------------------------------------------
+import time
+from prof import NoProfiler
+
+clock = getattr(time, "perf_counter", time.time)
+
+
+class Pass(object):  # named transformation or analysis
+    __slots__ = ('name', 'run', 'requires', 'provides', 'invalidates')
+
+    def __init__(self, name, run, requires=(), provides=(), invalidates=()):
+        self.name = name
+        self.run = run                  # function without arguments, returns pass result
+        self.requires = requires        # analyses valid before run
+        self.provides = provides        # analyses valid after run
+        self.invalidates = invalidates  # analyses changed by run
+
+
+class PassManager(object):
+
+    def __init__(self, prof=None, ir=None):
+        self.prof = prof or NoProfiler()
+        self.ir = ir            # function returning IR for profile node counts
+        self.passes = {}        # name -> Pass
+        self.provider = {}      # analysis -> name of pass providing it
+        self.valid = set()      # valid analyses
+        self.results = {}       # pass name -> result of last run
+        self.times = []         # (pass name, time) of runs in order
+
+    def add(self, name, run, requires=(), provides=(), invalidates=()):
+        p = Pass(name, run, requires, provides, invalidates)
+        self.passes[name] = p
+        for a in provides:
+            self.provider.setdefault(a, name)
+        return p
+
+    def run(self, name):  # run pass after its missing required analyses, return result
+        p = self.passes[name]
+        for a in p.requires:
+            if a not in self.valid:
+                if a not in self.provider:
+                    raise KeyError("pass " + name + ": no pass provides " + a)
+                self.run(self.provider[a])
+        with self.prof.phase(name) as ph:
+            t0 = clock()
+            r = p.run()
+            self.times.append((name, clock() - t0))
+            if self.ir is not None:
+                ph.ir = self.ir()
+        self.valid.difference_update(p.invalidates)
+        self.valid.update(p.provides)
+        self.results[name] = r
+        return r
+
+    def get(self, analysis):  # result of analysis pass, run only if not valid
+        name = self.provider[analysis]
+        if analysis not in self.valid:
+            self.run(name)
+        return self.results.get(name)
+
+    def invalidate(self, *analyses):
+        self.valid.difference_update(analyses)
+
+    def timings(self):  # total time per pass name: [(name, time, runs)] in first run order
+        d = {}
+        order = []
+        for (name, t) in self.times:
+            if name not in d:
+                d[name] = [0.0, 0]
+                order.append(name)
+            d[name][0] += t
+            d[name][1] += 1
+        return [(name, d[name][0], d[name][1]) for name in order]
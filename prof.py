@@ -0,0 +1,136 @@
+# -------------------------------------------------------------------------------
+# prof.py
+#
+# Per-phase profiling for pipeline synthesis tool: wall time, peak memory
+# (tracemalloc, Python 3) and IR node counts, saved as JSON
+#
+# Copyright (C) 2017, Andrej Trost
+# License: MIT
+# -------------------------------------------------------------------------------
+import time
+from pyprog import Op, Assign, Body, Block, IfElse
+
+clock = getattr(time, "perf_counter", time.time)
+
+
+def ir_nodes(x, count=None):  # count IR nodes of block, body, statement or expression by class name
+    if count is None:
+        count = {}
+    if x is None:
+        return count
+    name = x.__class__.__name__
+    count[name] = count.get(name, 0) + 1
+    if isinstance(x, Op):
+        for y in [x.left, x.right]:
+            if isinstance(y, Op):
+                ir_nodes(y, count)
+    elif isinstance(x, Assign):
+        for op in x.oplist:
+            ir_nodes(op, count)
+    elif isinstance(x, Body):
+        for st in x.stlist:
+            ir_nodes(st, count)
+    elif isinstance(x, Block):
+        if isinstance(x, IfElse):
+            for op in x.cond.oplist:
+                ir_nodes(op, count)
+            ir_nodes(x.elsbody, count)
+        else:
+            count["Var"] = count.get("Var", 0) + len(x.vardict)
+        ir_nodes(x.body, count)
+    return count
+
+
+class Phase(object):  # context of one measured phase, ir: measured IR object (may be set inside)
+    def __init__(self, prof, name, ir):
+        self.prof = prof
+        self.name = name
+        self.ir = ir
+        self.t0 = 0
+        self.mem0 = 0
+        self.peak = 0    # max peak of finished subphases
+
+    def __enter__(self):
+        if self.prof is not None:
+            self.prof.start(self)
+        return self
+
+    def __exit__(self, etype, value, tb):
+        if self.prof is not None:
+            self.prof.stop(self)
+        return False
+
+
+class Profiler(object):  # records phases: [{name, parent, time_s, peak_kb, alloc_kb, nodes}]
+    def __init__(self, memory=True):
+        self.phases = []
+        self.stack = []
+        self.tm = None
+        if memory:
+            try:
+                import tracemalloc
+                self.tm = tracemalloc
+            except ImportError:  # Python 2: time and node counts only
+                pass
+        self.memory = self.tm is not None
+        self.tracing = False    # tracing started by the profiler, stopped by close()
+        if self.memory and not self.tm.is_tracing():
+            self.tm.start()
+            self.tracing = True
+
+    def phase(self, name, ir=None):
+        return Phase(self, name, ir)
+
+    def start(self, ph):
+        if self.memory:
+            ph.mem0, peak = self.tm.get_traced_memory()
+            if self.stack:  # keep peak of enclosing phase, measure this one from here
+                self.stack[-1].peak = max(self.stack[-1].peak, peak)
+            if hasattr(self.tm, "reset_peak"):
+                self.tm.reset_peak()
+        self.stack.append(ph)
+        ph.t0 = clock()
+
+    def stop(self, ph):
+        t = clock() - ph.t0
+        self.stack.pop()
+        rec = {"name": ph.name, "time_s": t}
+        if self.stack:
+            rec["parent"] = self.stack[-1].name
+        if self.memory:
+            mem, peak = self.tm.get_traced_memory()
+            peak = max(peak, ph.peak)
+            rec["peak_kb"] = peak / 1024.0
+            rec["alloc_kb"] = (mem - ph.mem0) / 1024.0
+            if self.stack:
+                self.stack[-1].peak = max(self.stack[-1].peak, peak)
+        if ph.ir is not None:
+            rec["nodes"] = ir_nodes(ph.ir)
+        self.phases.append(rec)
+
+    def report(self):
+        print ("Profile:")
+        for rec in self.phases:
+            s = "  " if "parent" in rec else ""
+            s += "%-20s %8.4f s" % (rec["name"], rec["time_s"])
+            if "peak_kb" in rec:
+                s += " %10.1f kB peak" % rec["peak_kb"]
+            if "nodes" in rec:
+                s += " %8d nodes" % sum(rec["nodes"].values())
+            print (s)
+
+    def close(self):  # end of profiling: stop memory tracing if the profiler started it
+        if self.tracing:
+            self.tm.stop()
+            self.tracing = False
+
+    def save(self, fname):  # write phases as JSON
+        import json
+        f = open(fname, 'w')
+        json.dump({"phases": self.phases}, f, indent=1, sort_keys=True)
+        f.close()
+
+
+class NoProfiler(object):  # profiling disabled
+    def phase(self, name, ir=None):
+        return Phase(None, name, ir)
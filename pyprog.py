@@ -7,30 +7,84 @@
 # License: MIT
 # -------------------------------------------------------------------------------
 from __future__ import print_function
-from math import log
 
 
 def tab(x): return " "*4*x  # define tab for ident
 
 
+class Writer:  # file-like string collector, code() methods write to it and join once
+    def __init__(self):
+        self.parts = []
+
+    def write(self, s):
+        self.parts.append(s)
+
+    def getvalue(self):
+        return "".join(self.parts)
+
+
+class SynthError(Exception):  # synthesis error of parser or transformation
+    pass
+
+
+class ParseError(SynthError):  # parser error at source line
+    def __init__(self, msg, line):
+        SynthError.__init__(self, "Line " + str(line) + " Error: " + msg)
+        self.line = line
+
+
+slotnames = {}  # class -> names of all slots (copy_slots)
+
+
+def copy_slots(x, memo):  # shallow copy of slotted IR object x, registered in memo {id: copy}
+    cls = x.__class__
+    names = slotnames.get(cls)
+    if names is None:
+        names = [n for c in cls.__mro__ for n in getattr(c, '__slots__', ())]
+        slotnames[cls] = names
+    y = cls.__new__(cls)
+    for n in names:
+        setattr(y, n, getattr(x, n))
+    memo[id(x)] = y
+    return y
+
+
 class Signal:
     no, inport, outport, int = range(4)
 
 
-class Lit:  # literal superclass
-    name = ""
-    init = 0
-    # mode = 0
-    size = 0
-    value = 0
+class Opc:  # integer operation codes of Op
+    load, add, sub, mul, shr, eq, ne, ge, le, gt, lt, land, lor, lnot, signal, shl = range(16)
+
+
+opnames = ['load', '+', '-', '*', '>>', '==', '!=', '>=', '<=', '>', '<', 'and', 'or', 'not', 'signal', '<<']
+opcodes = dict([(name, i) for (i, name) in enumerate(opnames)])
+opcodes.update({'': Opc.load, '&': Opc.load})  # assignment and condition load
+# evaluation of constant operands (Op.eval), comparisons and logic operators give 0 or 1
+opfuncs = {Opc.load: lambda l, r: l, Opc.add: lambda l, r: l + r, Opc.sub: lambda l, r: l - r,
+           Opc.mul: lambda l, r: l * r, Opc.shr: lambda l, r: l >> r, Opc.shl: lambda l, r: l << r,
+           Opc.eq: lambda l, r: int(l == r), Opc.ne: lambda l, r: int(l != r), Opc.ge: lambda l, r: int(l >= r),
+           Opc.le: lambda l, r: int(l <= r), Opc.gt: lambda l, r: int(l > r), Opc.lt: lambda l, r: int(l < r),
+           Opc.land: lambda l, r: int(bool(l and r)), Opc.lor: lambda l, r: int(bool(l or r)),
+           Opc.lnot: lambda l, r: int(not r)}
+
+
+class Lit(object):  # literal superclass
+    __slots__ = ('name', 'init', 'size', 'value', 'tree_level')
 
     def __init__(self, s):
         self.name = s
+        self.init = 0
+        self.size = 0
+        self.value = 0
         self.tree_level = -1  # data flow tree level, -1 = undefined
 
     def set_tree_level(self, l):
         self.tree_level = l
 
+    def clone(self, memo=None):  # constants are not changed by transformations: shared
+        return self
+
     def code(self):
         return str(self.name)
 
@@ -39,16 +93,23 @@ class Lit:  # literal superclass
     
 
 class Var(Lit):
+    __slots__ = ('mode', 'register', 'reglevel', 'wrap')
+
     def __init__(self, s):
         Lit.__init__(self, s)
-        self.mode = 0
         self.mode = 0  # set initial value
         self.register = False
         self.reglevel = 0  # or -1 ?
+        self.wrap = False  # values exceed size and wrap (MyHDL modbv signal)
 
     def settype(self, n):
         self.mode = n
 
+    def clone(self, memo=None):  # copy, one per variable in memo
+        if memo is None:
+            memo = {}
+        return memo.get(id(self)) or copy_slots(self, memo)
+
     def setsize(self, n):
         self.size = n
 
@@ -76,10 +137,12 @@ class Var(Lit):
 
 
 class Num(Lit):
+    __slots__ = ()
+
     def __init__(self, s):
         Lit.__init__(self, s)
         self.value = int(s)
-        self.size = int(log(abs(self.value), 2)) + 2  # no. of signed bits
+        self.size = abs(self.value).bit_length() + 1  # no. of signed bits, 1 for 0
 
     def code(self):
         return str(self.value)
@@ -89,6 +152,8 @@ class Num(Lit):
 
 
 class Bool(Lit):
+    __slots__ = ()
+
     def __init__(self, s):
         Lit.__init__(self, s)
         if s == "True":
@@ -102,104 +167,117 @@ class Bool(Lit):
         return "(bool: "+str(self.name)+")"
 
 
-class Return:
+class Return(object):
+    __slots__ = ('varlist', 'instances')
+
     def __init__(self, v):
         self.varlist = v
         self.instances = False
 
+    def clone(self, memo=None):
+        if memo is None:
+            memo = {}
+        y = memo.get(id(self))
+        if y is None:
+            y = copy_slots(self, memo)
+            y.varlist = [v.clone(memo) for v in self.varlist]
+        return y
+
     def emit(self):
-        s = "return "
-        first = True
-        for v in self.varlist:
-            if first:
-                s += v.emit()
-                first = False
-            else:
-                s += ", "+v.emit()
-        s += "\n"
-        return s
+        return "return " + ", ".join([v.emit() for v in self.varlist]) + "\n"
 
-    def code(self, level):
-        s = tab(level)+"return "
+    def write(self, f, level):
+        f.write(tab(level)+"return ")
         if self.instances:
-            s += "instances()"
+            f.write("instances()")
         else:
-            first = True
-            for v in self.varlist:
-                if first:
-                    s += v.code()
-                    first = False
-                else:
-                    s += ", "+v.code()
-        s += "\n"
-        return s
+            f.write(", ".join([v.code() for v in self.varlist]))
+        f.write("\n")
 
+    def code(self, level):
+        w = Writer()
+        self.write(w, level)
+        return w.getvalue()
+
+
+class Op(object):
+    __slots__ = ('left', 'opc', 'right', 'size', 'tree_level')
 
-class Op:
     def __init__(self, l, o1, r):  # binary operation: left, operator, right
         self.left = l
-        self.op = o1
+        self.opc = opcodes[o1]  # integer operation code (Opc)
         self.right = r
-
-    def eval(self):
-        if isinstance(self.left, Op):
-            lv = self.left.eval()
-        else:
-            lv = self.left.value
-        if isinstance(self.right, Op):
-            rv = self.right.eval()
-        else:
-            rv = self.right.value
-
-        return eval(lv + self.op + rv)  # instead of: if self.op == "+": return lv+rv ...
-        # if self.op == "+":
-        #     return lv + rv
-        # elif self.op == "-":
-        #     return lv - rv
-        # elif self.op == "*":
-        #     return lv * rv
-        # elif self.op == "==":
-        #     return lv == rv
-        # elif self.op == "!=":
-        #     return lv != rv
-        # elif self.op == ">=":
-        #     return lv >= rv
-        # elif self.op == "<=":
-        #     return lv <= rv
-        # elif self.op == ">":
-        #     return lv > rv
-        # elif self.op == "<":
-        #     return lv < rv
-        # else:
-        #     return -1  # unexpected
-
-    def code(self):
+        self.size = 0          # result size and data flow tree level (set by analysis)
+        self.tree_level = -1
+
+    def getop(self):  # operator string
+        return opnames[self.opc]
+
+    def setop(self, o1):
+        self.opc = opcodes[o1]
+
+    op = property(getop, setop)
+
+    def clone(self, memo=None):  # copy expression tree
+        if memo is None:
+            memo = {}
+        y = memo.get(id(self))
+        if y is None:
+            y = copy_slots(self, memo)
+            if self.left is not None:
+                y.left = self.left.clone(memo)
+            if self.right is not None:
+                y.right = self.right.clone(memo)
+        return y
+
+    def eval(self):  # value of constant expression (Num, Bool operands), None if not constant
+        v = []
+        for x in [self.left, self.right]:
+            if isinstance(x, Op):
+                x = x.eval()
+            elif x is None:     # load: no right, not: no left operand
+                x = 0
+            elif isinstance(x, (Num, Bool)):
+                x = x.value
+            else:
+                return None
+            if x is None:
+                return None
+            v.append(x)
+        if (self.opc == Opc.shr or self.opc == Opc.shl) and v[1] < 0:
+            return None
+        f = opfuncs.get(self.opc)
+        if f is None:   # signal declaration
+            return None
+        return f(v[0], v[1])
+
+    def write(self, f):  # write expression code to file-like f
         if self.left is None:
             if self.right is None:
-                s = " '" + self.op + "' "
-            else:
-                s = " " + self.op + " "
-                if isinstance(self.right, Op):
-                    s += "("+self.right.code()+")"
-                else:
-                    s += self.right.code()
-        elif self.right is None:
-            if isinstance(self.left, Op):
-                s = "("+self.left.code()+") "
-            else:
-                s = self.left.code()+" "
+                f.write(" '" + self.op + "' ")
+                return
+            f.write(" " + self.op + " ")
         else:
             if isinstance(self.left, Op):
-                s = "("+self.left.code()+") "
+                f.write("(")
+                self.left.write(f)
+                f.write(") ")
             else:
-                s = self.left.code()+" "
-            s += self.op + " "
-            if isinstance(self.right, Op):
-                s += "("+self.right.code()+")"
-            else:
-                s += self.right.code()
+                f.write(self.left.code()+" ")
+            if self.right is None:
+                return
+            f.write(self.op + " ")
+        if isinstance(self.right, Op):
+            f.write("(")
+            self.right.write(f)
+            f.write(")")
+        else:
+            f.write(self.right.code())
 
-        return s
+    def code(self):
+        w = Writer()
+        self.write(w)
+        return w.getvalue()
 
     def emit(self):
         if self.left is None:
@@ -220,7 +298,9 @@ class Op:
             return s
 
 
-class Assign:
+class Assign(object):
+    __slots__ = ('target', 'oplist', 'cond', 'condition', 'clist', 'nxt')
+
     def __init__(self, t):
         self.target = t
         self.oplist = []        # list of operators in expression (oplist[0] = expression tree root)
@@ -234,6 +314,19 @@ class Assign:
     def addop(self, op):
         self.oplist.append(op)
 
+    def clone(self, memo=None):
+        if memo is None:
+            memo = {}
+        y = memo.get(id(self))
+        if y is None:
+            y = copy_slots(self, memo)
+            y.target = self.target.clone(memo)
+            y.oplist = [op.clone(memo) for op in self.oplist]
+            if self.condition is not None:
+                y.condition = self.condition.clone(memo)
+            y.clist = [(c.clone(memo), b) for (c, b) in self.clist]
+        return y
+
     def eval(self):
         if len(self.oplist) == 1:
             return self.oplist[0].eval()
@@ -241,62 +334,61 @@ class Assign:
             print ("Can't evaluate this.")
             return -1
 
-    def code(self, level):
-        s = tab(level) + self.target.code()
+    def write(self, f, level):
+        f.write(tab(level) + self.target.code())
         if self.nxt:
-            s += ".next = "
+            f.write(".next = ")
         else:
-            s += " = "
-        if self.oplist[0].op == "signal":
-            s += "Signal"
+            f.write(" = ")
+        if self.oplist[0].opc == Opc.signal:
             v = self.target
             if v.size <= 1:
-                s += "(bool(" + str(v.init) + "))"
+                f.write("Signal(bool(" + str(v.init) + "))")
             else:
-                s += "(intbv(" + str(v.init) + ", min=-2**" + str(v.size-1)
-                s += ", max=2**" + str(v.size-1) + "))"
+                f.write("Signal(" + ("modbv(" if v.wrap else "intbv(") + str(v.init) + ", min=-2**" +
+                        str(v.size-1) + ", max=2**" + str(v.size-1) + "))")
         else:
             for op in self.oplist:
-                s += op.code()
-        s += "\n"
-        return s
+                op.write(f)
+        f.write("\n")
+
+    def code(self, level):
+        w = Writer()
+        self.write(w, level)
+        return w.getvalue()
 
     def emit(self):
-        s = "A (target: "+self.target.emit()+"["
+        s = ["A (target: "+self.target.emit()+"["]
         for op in self.oplist:
-            s += op.emit()
-        s += "] "
-        if self.clist:
-            for (cond, b) in self.clist:
-            #     (cond, b) = self.clist[0]
-                s += "?"
-                if not b:
-                    s += "not "
-            # (cond, b) = self.clist[0]
-            # if b:
-            #     s += "IF "
-            # else:
-            #     s += "ELSE "
-                s += cond.emit()
-        # if self.cond > 0:
-        #     if self.cond == 1:
-        #         s += "IF "
-        #     else:
-        #         s += "ELSE "
-        #     s += self.condition.emit()
-        s += ")\n"
-        return s
+            s.append(op.emit())
+        s.append("] ")
+        for (cond, b) in self.clist:
+            s.append("?")
+            if not b:
+                s.append("not ")
+            s.append(cond.emit())
+        s.append(")\n")
+        return "".join(s)
 
 
-class Condition:
-    oplist = []  # operator list
+class Condition(object):
+    __slots__ = ('oplist',)
 
     def __init__(self):
-        self.oplist = []
+        self.oplist = []  # operator list
 
     def addop(self, op):
         self.oplist.append(op)
 
+    def clone(self, memo=None):
+        if memo is None:
+            memo = {}
+        y = memo.get(id(self))
+        if y is None:
+            y = copy_slots(self, memo)
+            y.oplist = [op.clone(memo) for op in self.oplist]
+        return y
+
     def eval(self):
         if len(self.oplist) == 1:
             return self.oplist[0].eval()
@@ -304,22 +396,21 @@ class Condition:
             print ("Can't evaluate this.")
             return -1
 
-    def code(self):
-        s = ""
+    def write(self, f):
         for op in self.oplist:
-            s += op.code()
-        return s
+            op.write(f)
+
+    def code(self):
+        w = Writer()
+        self.write(w)
+        return w.getvalue()
 
     def emit(self):
-        s = "COND ["
-        for op in self.oplist:
-            s += op.emit()
-        s += "]"
-        return s
+        return "COND [" + "".join([op.emit() for op in self.oplist]) + "]"
 
 
-class Block:  # block of code, super class
-    name = ""
+class Block(object):  # block of code, super class
+    __slots__ = ('name', 'body', 'vardict')
 
     def __init__(self, name, level=0):
         self.name = name    # name string
@@ -329,6 +420,19 @@ class Block:  # block of code, super class
     def add_to_body(self, st):  # add statement to block body
         self.body.add(st)
 
+    def clone(self, memo=None):  # copy of block for transformation, the original is not changed
+        if memo is None:
+            memo = {}
+        y = memo.get(id(self))
+        if y is None:
+            y = copy_slots(self, memo)
+            self.clone_into(y, memo)
+        return y
+
+    def clone_into(self, y, memo):  # copy variables and body into clone y
+        y.vardict = dict([(name, v.clone(memo)) for (name, v) in self.vardict.items()])
+        y.body = self.body.clone(memo)
+
     def add_var(self, v):  # add block variable, create dictionary entry
         self.vardict.update({v.name: v})
 
@@ -340,24 +444,23 @@ class Block:  # block of code, super class
             self.vardict.update({name: v})
             return v
 
+    def write(self, f, level=0):
+        f.write("Code")
+
     def code(self, level=0):
-        return "Code"
+        w = Writer()
+        self.write(w, level)
+        return w.getvalue()
+
+    def emit_vars(self):
+        return "".join([" "+v.emit() for v in self.vardict.values()]) + "\n"
 
     def emit(self):
-        s = "Block: "+self.name+"\n"
-        for key in self.vardict:
-            s += " "+self.vardict[key].emit()
-        s += "\n"
-        s += self.body.emit()
-        s += "\n"
-        # s += "Return: "+self.returnvar.emit()+"\n"
-        return s
-        # return "Block!"
+        return "Block: "+self.name+"\n" + self.emit_vars() + self.body.emit() + "\n"
 
 
-class Body:
-    stlist = []
-    level = 0
+class Body(object):
+    __slots__ = ('stlist', 'level')
 
     def __init__(self, level):
         self.stlist = []
@@ -366,6 +469,15 @@ class Body:
     def add(self, st):
         self.stlist.append(st)
 
+    def clone(self, memo=None):
+        if memo is None:
+            memo = {}
+        y = memo.get(id(self))
+        if y is None:
+            y = copy_slots(self, memo)
+            y.stlist = [st.clone(memo) for st in self.stlist]
+        return y
+
     # def geti(self, i):
     #     return self.stlist[i]
     # def getstatement(self):
@@ -379,33 +491,39 @@ class Body:
     def insert(self, i, st):
         self.stlist.insert(i, st)
 
-    def code(self):
-        s = ""
+    def write(self, f):
         for st in self.stlist:
-            s += st.code(self.level)
-        return s
+            st.write(f, self.level)
+
+    def code(self):
+        w = Writer()
+        self.write(w)
+        return w.getvalue()
 
     def emit(self):
         s = "Body <"+str(self.level)+">: "
         if len(self.stlist) > 0:
-            s += "\n"
-            for st in self.stlist:
-                s += " " + st.emit()
-        else:
-            s += "()\n"
-        return s
+            return s + "\n" + "".join([" " + st.emit() for st in self.stlist])
+        return s + "()\n"
 
 
 class IfElse(Block):
-    truebody = True
-    cond = Condition()
+    __slots__ = ('cond', 'elsbody', 'scopeblock', 'truebody')
 
     def __init__(self, sb):
         Block.__init__(self, "if", sb.body.level+1)
+        self.cond = Condition()
         self.elsbody = None   #
         self.scopeblock = sb  # access upper block to get variable scope
         self.truebody = True
 
+    def clone_into(self, y, memo):
+        y.scopeblock = self.scopeblock.clone(memo)
+        y.cond = self.cond.clone(memo)
+        Block.clone_into(self, y, memo)
+        if self.elsbody is not None:
+            y.elsbody = self.elsbody.clone(memo)
+
     def elsebody(self, sb):  # add elsbody (level <- sb)
         self.elsbody = Body(sb.body.level+1)
         self.truebody = False
@@ -431,76 +549,51 @@ class IfElse(Block):
     def eval(self):
         return self.cond.eval()
 
-    def code(self, level=0):
-        s = tab(level) + "if "+self.cond.code()+":\n"
-        s += self.body.code()
+    def write(self, f, level=0):
+        f.write(tab(level) + "if ")
+        self.cond.write(f)
+        f.write(":\n")
+        if self.body.stlist:
+            self.body.write(f)
+        else:           # else body only
+            f.write(tab(self.body.level) + "pass\n")
         if not (self.elsbody is None):
-            s += tab(level) + "else:\n"
-            s += self.elsbody.code()
-        return s
+            f.write(tab(level) + "else:\n")
+            self.elsbody.write(f)
 
     def emit(self):
-        s = "IF " + self.cond.emit()+"\n"
-        s += self.body.emit()
+        s = "IF " + self.cond.emit()+"\n" + self.body.emit()
         if not (self.elsbody is None):
-            s += "ELSE \n"
-            s += self.elsbody.emit()
-        s += "ENDIF\n"
-        return s
+            s += "ELSE \n" + self.elsbody.emit()
+        return s + "ENDIF\n"
 
 
 class Function(Block):
+    __slots__ = ('decorator',)
+
     def __init__(self, name, sb):
         Block.__init__(self, name, sb.body.level+1)
         self.decorator = ""
 
-    def code(self, level=0):
-        s = "\n"
+    def write(self, f, level=0):
+        f.write("\n")
         if self.decorator != "":
-            s += tab(level)+self.decorator+"\n"
-        s += tab(level) + "def "+self.name+"("
-        first = True
-        for key in self.vardict:
-            if self.vardict[key].mode == Signal.inport:  # inport
-                if first:
-                    s += self.vardict[key].name
-                    first = False
-                else:
-                    s += ", "+self.vardict[key].name
-        for key in self.vardict:
-            if self.vardict[key].mode == Signal.outport:  # outport
-                if first:
-                    s += self.vardict[key].name
-                    first = False
-                else:
-                    s += ", "+self.vardict[key].name
-        s += "):\n"
-        s += self.body.code()
-        s += "\n"
-        return s
+            f.write(tab(level)+self.decorator+"\n")
+        ports = [v.name for v in self.vardict.values() if v.mode == Signal.inport]  # inports, then outports
+        ports += [v.name for v in self.vardict.values() if v.mode == Signal.outport]
+        f.write(tab(level) + "def "+self.name+"(" + ", ".join(ports) + "):\n")
+        self.body.write(f)
+        f.write("\n")
 
     def emit(self):
-        s = "Def: "+self.name+"\n"
-        for key in self.vardict:
-            s += " "+self.vardict[key].emit()
-        s += "\n"
-        s += self.body.emit()
-        s += "\n"
-        # s += "Return: "+self.returnvar.emit()+"\n"
-        return s
+        return "Def: "+self.name+"\n" + self.emit_vars() + self.body.emit() + "\n"
 
 
 class PyProg(Block):
+    __slots__ = ()
 
-    def code(self, level=0):
-        s = self.body.code()
-        return s
+    def write(self, f, level=0):
+        self.body.write(f)
 
     def emit(self):
-        s = "Program: "+self.name+"\n"
-        for key in self.vardict:
-            s += " "+self.vardict[key].emit()
-        s += "\n"
-        s += self.body.emit()
-        s += "End"
-        return s
+        return "Program: "+self.name+"\n" + self.emit_vars() + self.body.emit() + "End"
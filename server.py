@@ -0,0 +1,243 @@
+# -------------------------------------------------------------------------------
+# server.py
+#
+# Compile server for pipeline synthesis tool: keeps the tool, interface template
+# and output cache loaded and synthesizes requests from a local socket
+# Protocol: one JSON object per line
+#   request:  {"source": text, "ini": text, "name": "test", "template": text (optional)}
+#             {"cmd": "stats"}
+#   response: {"ok": true, "artifacts": {file name: text}, "log": text, "cached": bool, "time_s": t}
+#             {"ok": false, "error": text, "log": text}
+# run: python server.py serve [--unix PATH | --port N]
+#      python server.py compile test.py rp.ini [--unix PATH | --port N]
+#
+# Copyright (C) 2017, Andrej Trost
+# License: MIT
+# -------------------------------------------------------------------------------
+from __future__ import print_function
+import json
+import os
+import socket
+import sys
+import threading
+import time
+from collections import OrderedDict
+try:
+    import SocketServer as socketserver
+except ImportError:  # Python 3
+    import socketserver
+from pyprog import Writer, SynthError
+from cache import text_key, tool_version, read_text
+from PyPipeSynth import synthesize, template_file, outputs
+
+clock = getattr(time, "perf_counter", time.time)
+address = ("127.0.0.1", 8717)   # default server address
+
+
+class Stats:  # request latency and queue depth
+
+    def __init__(self, keep=1000):
+        self.lock = threading.Lock()
+        self.keep = keep        # latencies kept for percentiles
+        self.latency = []
+        self.requests = 0
+        self.errors = 0
+        self.hits = 0
+        self.depth = 0          # requests waiting or running
+        self.max_depth = 0
+
+    def enter(self):
+        with self.lock:
+            self.depth += 1
+            self.max_depth = max(self.max_depth, self.depth)
+
+    def leave(self, t, ok, hit):
+        with self.lock:
+            self.depth -= 1
+            self.requests += 1
+            self.errors += not ok
+            self.hits += hit
+            self.latency.append(t)
+            if len(self.latency) > self.keep:
+                del self.latency[0]
+
+    def get(self):
+        with self.lock:
+            lat = sorted(self.latency)
+            d = {"requests": self.requests, "errors": self.errors, "cache_hits": self.hits,
+                 "queue_depth": self.depth, "max_queue_depth": self.max_depth}
+        if lat:
+            d["latency_s"] = {"mean": sum(lat)/len(lat), "p50": lat[len(lat)//2],
+                              "p95": lat[min(len(lat)-1, int(len(lat)*0.95))], "max": lat[-1]}
+        return d
+
+
+class Synth:  # warm synthesis state: template, tool version and in-memory LRU output cache
+
+    def __init__(self, template=None, entries=256):
+        if template is None:
+            template = read_text(template_file)
+        self.template = template
+        self.version = tool_version()
+        self.entries = entries
+        self.cache = OrderedDict()
+        self.lock = threading.Lock()    # one synthesis at a time, others wait in queue
+        self.stats = Stats()
+
+    def request(self, req):  # return response for request dictionary
+        if req.get("cmd") == "stats":
+            return {"ok": True, "stats": self.stats.get()}
+        self.stats.enter()
+        t0 = clock()
+        ok = hit = False
+        try:
+            with self.lock:
+                resp = self.compile(req)
+            ok = resp["ok"]
+            hit = resp.get("cached", False)
+        finally:
+            t = clock() - t0
+            self.stats.leave(t, ok, hit)
+        resp["time_s"] = t
+        return resp
+
+    def compile(self, req):
+        template = req.get("template") or self.template
+        key = text_key(req["source"], req["ini"], template, self.version)
+        out = self.cache.get(key)
+        if out is not None:
+            del self.cache[key]     # move to most recently used
+            self.cache[key] = out
+            return {"ok": True, "artifacts": out, "log": "", "cached": True}
+
+        log = Writer()
+        try:
+            out = synthesize(req["source"], req["ini"], template, req.get("name", "test"), log)
+        except SynthError as e:
+            return {"ok": False, "error": str(e), "log": log.getvalue()}
+        except Exception as e:
+            return {"ok": False, "error": "%s: %s" % (e.__class__.__name__, e), "log": log.getvalue()}
+        self.cache[key] = out
+        if len(self.cache) > self.entries:
+            self.cache.popitem(last=False)
+        return {"ok": True, "artifacts": out, "log": log.getvalue(), "cached": False}
+
+
+class Handler(socketserver.StreamRequestHandler):  # JSON requests, one per line
+
+    def handle(self):
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                break
+            try:
+                req = json.loads(line.decode("utf-8"))
+                if not isinstance(req, dict):
+                    raise ValueError("not a JSON object")
+                resp = self.server.synth.request(req)
+            except (ValueError, KeyError) as e:
+                resp = {"ok": False, "error": "bad request: %s" % e}
+            except Exception as e:     # bad field types (TypeError), anything else: reply, keep connection
+                resp = {"ok": False, "error": "%s: %s" % (e.__class__.__name__, e)}
+            self.wfile.write((json.dumps(resp) + "\n").encode("utf-8"))
+            self.wfile.flush()
+
+
+class TCPServer(socketserver.ThreadingMixIn, socketserver.TCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+if hasattr(socketserver, "UnixStreamServer"):
+    class UnixServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+        daemon_threads = True
+
+
+def make_server(addr=address, synth=None):  # addr: unix socket path or (host, port)
+    if isinstance(addr, tuple):
+        server = TCPServer(addr, Handler)
+    else:
+        if os.path.exists(addr):
+            os.remove(addr)
+        server = UnixServer(addr, Handler)
+    server.synth = synth or Synth()
+    return server
+
+
+class Client:  # connection to compile server
+
+    def __init__(self, addr=address):
+        if isinstance(addr, tuple):
+            self.sock = socket.create_connection(addr)
+        else:
+            self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            self.sock.connect(addr)
+        self.f = self.sock.makefile("rwb")
+
+    def call(self, req):
+        self.f.write((json.dumps(req) + "\n").encode("utf-8"))
+        self.f.flush()
+        return json.loads(self.f.readline().decode("utf-8"))
+
+    def compile(self, source, ini, name="test", template=None):
+        req = {"source": source, "ini": ini, "name": name}
+        if template is not None:
+            req["template"] = template
+        return self.call(req)
+
+    def stats(self):
+        return self.call({"cmd": "stats"})["stats"]
+
+    def close(self):
+        self.f.close()
+        self.sock.close()
+
+
+def main(argv=None):
+    import argparse
+    ap = argparse.ArgumentParser(description="Pipeline synthesis compile server")
+    ap.add_argument("cmd", choices=["serve", "compile", "stats"])
+    ap.add_argument("files", nargs="*", help="compile: function file and ini file")
+    ap.add_argument("--unix", help="unix socket path")
+    ap.add_argument("--port", type=int, default=address[1], help="localhost TCP port (%d)" % address[1])
+    ap.add_argument("-o", "--outdir", default=".", help="compile: output directory")
+    args = ap.parse_args(argv)
+    addr = args.unix or (address[0], args.port)
+
+    if args.cmd == "serve":
+        server = make_server(addr)
+        print ("Serving on " + str(addr))
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        server.server_close()
+        return 0
+
+    c = Client(addr)
+    if args.cmd == "stats":
+        print (json.dumps(c.stats(), indent=1, sort_keys=True))
+        c.close()
+        return 0
+
+    if len(args.files) != 2:
+        ap.error("compile: expected function file and ini file")
+    name = os.path.basename(args.files[0])
+    if name.endswith(".py"):
+        name = name[:-3]
+    resp = c.compile(read_text(args.files[0]), read_text(args.files[1]), name)
+    c.close()
+    if not resp["ok"]:
+        print (resp.get("log", ""))
+        print ("Error: " + resp["error"])
+        return 1
+    for fname in outputs:
+        f = open(os.path.join(args.outdir, fname), 'w')
+        f.write(resp["artifacts"][fname])
+        f.close()
+    print ("%s: %.4f s%s" % (", ".join(outputs), resp["time_s"], " (cached)" if resp["cached"] else ""))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,190 @@
+# -------------------------------------------------------------------------------
+# sim.py
+#
+# Cycle simulation of the MyHDL wrapper program built by Transf.build_wrapper()
+# and equivalence check of the pipeline with the source Python function
+#   @always_comb blocks      -> assignments in dependency order, loops are errors
+#   @always(clk.posedge)     -> next values of all clocked blocks, set at the clock edge
+#   Signal sizes (signed)    -> values wrap to size bits as in Verilog, size <= 1: 0 or 1
+#   intbv signals            -> values out of range are errors as in MyHDL simulation (modbv wraps)
+#
+# Copyright (C) 2017, Andrej Trost
+# License: MIT
+# -------------------------------------------------------------------------------
+from __future__ import print_function
+import random
+from pyprog import Num, Bool, Op, Opc, Assign, IfElse, Function, opfuncs
+from dfg import expr_vars
+from verilog import body_targets
+
+
+def wrap(x, size):  # value x as signed size bits, size <= 1: bit
+    if size <= 1:
+        return x & 1
+    m = 1 << (size-1)
+    return ((x + m) & (2*m - 1)) - m
+
+
+def evaluate(op, values):  # value of expression tree with signal values {name: value}
+    v = []
+    for x in [op.left, op.right]:
+        if isinstance(x, Op):
+            x = evaluate(x, values)
+        elif x is None:     # load: no right, not: no left operand
+            x = 0
+        elif isinstance(x, (Num, Bool)):
+            x = x.value
+        else:
+            x = values[x.name]
+        v.append(x)
+    return opfuncs[op.opc](v[0], v[1])
+
+
+def body_reads(body, names):  # add names of variables read in body (and if statements) to names
+    for st in body.stlist:
+        if isinstance(st, Assign):
+            names.update([v.name for v in expr_vars(st.oplist[0], [])])
+        elif isinstance(st, IfElse):
+            names.update([v.name for v in expr_vars(st.cond.oplist[0], [])])
+            body_reads(st.body, names)
+            if st.elsbody is not None:
+                body_reads(st.elsbody, names)
+    return names
+
+
+class Sim(object):  # cycle simulation of wrapper program of Transf t (after build_wrapper)
+    __slots__ = ('sizes', 'wraps', 'comb', 'clocked', 'values', 'errors')
+
+    def __init__(self, t):
+        fn = t.myp.body.stlist[0]   # MyHDL proc function: signals, comb blocks, clocked blocks
+        self.sizes = {}             # declared signal name -> size (ports and internal signals)
+        self.wraps = set()          # names of signals declared as modbv
+        for st in t.myp.body.stlist[1:] + fn.body.stlist:
+            if isinstance(st, Assign) and st.oplist[0].opc == Opc.signal:
+                self.sizes[st.target.name] = st.target.size
+                if st.target.wrap:
+                    self.wraps.add(st.target.name)
+        self.comb = []              # comb assignments in dependency order
+        self.clocked = []           # clocked block bodies
+        self.errors = []            # multiple drivers, undeclared signals, comb loops, intbv overflow
+
+        driver = {}     # by name: generated code does not tell variables of the same name apart
+        comb = {}       # comb target name -> assignment
+        reads = set()
+        for blk in fn.body.stlist:
+            if not isinstance(blk, Function):
+                continue
+            if blk.decorator == "@always_comb":
+                targets = [st.target for st in blk.body.stlist]
+                for st in blk.body.stlist:
+                    comb[st.target.name] = st
+            else:
+                targets = body_targets(blk.body, set())
+                self.clocked.append(blk.body)
+            for v in targets:
+                if v.name in driver:
+                    self.errors.append("multiple drivers: " + v.name + " (" + driver[v.name] + ", " + blk.name + ")")
+                driver[v.name] = blk.name
+                reads.add(v.name)
+            body_reads(blk.body, reads)
+        for name in sorted(reads):
+            if name not in self.sizes:
+                self.errors.append("undeclared signal: " + name)
+
+        state = {}      # comb target name -> 1: visiting, 2: ordered
+        for name in sorted(comb):
+            self.order(name, comb, state)
+        self.values = dict([(name, 0) for name in self.sizes])
+
+    def order(self, name, comb, state):  # append comb assignment of name after the ones it reads
+        s = state.get(name)
+        if s == 2:
+            return
+        if s == 1:
+            self.errors.append("combinational loop: " + name)
+            return
+        state[name] = 1
+        for v in expr_vars(comb[name].oplist[0], []):
+            if v.name in comb:
+                self.order(v.name, comb, state)
+        state[name] = 2
+        self.comb.append(comb[name])
+
+    def value(self, name, x):  # value x assigned to signal name
+        y = wrap(x, self.sizes[name])
+        if y != x and self.sizes[name] > 1 and name not in self.wraps:
+            error = "intbv overflow: " + name
+            if error not in self.errors:
+                self.errors.append(error)
+        return y
+
+    def set(self, name, x):
+        self.values[name] = self.value(name, x)
+
+    def run_body(self, body, nxt):  # next values {name: value} of clocked body assignments
+        for st in body.stlist:
+            if isinstance(st, Assign):
+                nxt[st.target.name] = self.value(st.target.name, evaluate(st.oplist[0], self.values))
+            elif isinstance(st, IfElse):
+                if evaluate(st.cond.oplist[0], self.values):
+                    self.run_body(st.body, nxt)
+                elif st.elsbody is not None:
+                    self.run_body(st.elsbody, nxt)
+
+    def step(self, inputs):  # one clock cycle with input values {name: value}, return signal values before the edge
+        for (name, x) in inputs.items():
+            self.set(name, x)
+        for st in self.comb:
+            self.set(st.target.name, evaluate(st.oplist[0], self.values))
+        values = dict(self.values)
+        nxt = {}
+        for body in self.clocked:
+            self.run_body(body, nxt)
+        self.values.update(nxt)
+        return values
+
+
+def equivalent(t, source, cycles=100, runs=3, seed=1):  # simulate wrapper of t against function source, return errors
+    """
+- stream inputs (a, b) get a random value each cycle, other inputs a random value each run
+- function results wrap to the output sizes, an output may follow the inputs by 0 .. latency+1 cycles
+- cycles where the function reads a variable of a branch not taken are not compared
+    """
+    from PyPipeSynth import is_stream_var
+    sim = Sim(t)
+    if sim.errors:
+        return sim.errors
+    scope = {}
+    exec(compile(source, "<source>", "exec"), scope)
+    f = scope[t.fn.name]
+    args = f.__code__.co_varnames[:f.__code__.co_argcount]
+    inputs = [v for v in t.myp.body.stlist[0].vardict.values() if v.name in args]
+    outputs = t.return_varlist
+    rnd = random.Random(seed)
+    errors = []
+    for run in range(runs):
+        sim = Sim(t)
+        const = dict([(v.name, wrap(rnd.getrandbits(max(v.size, 1)), v.size)) for v in inputs])
+        ref = []
+        got = []
+        for i in range(cycles):
+            x = dict(const)
+            for v in inputs:
+                if is_stream_var(v.name):
+                    x[v.name] = wrap(rnd.getrandbits(max(v.size, 1)), v.size)
+            try:
+                r = f(*[x.get(name, 0) for name in args])
+                if len(outputs) == 1:
+                    r = (r,)
+                ref.append([wrap(r[j], outputs[j].size) for j in range(len(outputs))])
+            except NameError:   # variable assigned only in a branch not taken: hardware keeps its value
+                ref.append([None] * len(outputs))
+            values = sim.step(x)
+            got.append([values[v.name] for v in outputs])
+        errors += [e for e in sim.errors if e not in errors]
+        for j in range(len(outputs)):
+            shifts = [s for s in range(t.latency() + 2)
+                      if not [i for i in range(cycles-s) if ref[i][j] is not None and got[i+s][j] != ref[i][j]]]
+            if not shifts:
+                errors.append("run %d: output %s differs from function" % (run, outputs[j].name))
+    return errors
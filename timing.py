@@ -0,0 +1,213 @@
+# -------------------------------------------------------------------------------
+# timing.py
+#
+# FPGA operator delay/area model and static timing estimate for pipeline synthesis tool
+# Device: characterisation table of operator classes, delay (ns) and LUT, FF, DSP cost
+# per operator and bit width, devices can be added to the devices dictionary
+#   add, cmp:   LUT + carry chain of width
+#   mul:        DSP48 slices (combinational), wider products cascade slices
+#   mux:        conditional register assignment (if statement in clocked block)
+#   preadd, postadd: add/sub mapped to DSP48 pre-adder and post-adder (role "pre", "post")
+#   shift by constant, load: wiring
+#   DSP slice and register bit in LUT area: LUT/DSP and LUT/FF ratio of device
+#   (constant multipliers to shift-add, csd.py)
+# static_timing: paths to the registers of each pipeline stage (clocked block and DSP group
+# blocks) and to the outputs of each @always_comb block of the MyHDL wrapper (Transf.build_wrapper)
+#
+# Copyright (C) 2017, Andrej Trost
+# License: MIT
+# -------------------------------------------------------------------------------
+from __future__ import print_function
+from pyprog import SynthError, Var, Op, Opc, Assign, IfElse, Function
+
+opclass = {Opc.add: "add", Opc.sub: "add", Opc.mul: "mul",
+           Opc.eq: "cmp", Opc.ne: "cmp", Opc.ge: "cmp", Opc.le: "cmp", Opc.gt: "cmp", Opc.lt: "cmp",
+           Opc.land: "logic", Opc.lor: "logic", Opc.lnot: "logic"}
+
+
+class Device(object):  # operator characterisation of FPGA device
+    __slots__ = ('name', 'table', 'dsp', 'register', 'resources')
+
+    def __init__(self, name, table, dsp, register, resources):
+        self.name = name
+        self.table = table          # operator class -> (delay, delay per bit or cascaded DSP, LUT per bit)
+        self.dsp = dsp              # signed multiplier size of DSP slice (a, b)
+        self.register = register    # clock-to-out + setup of register (ns)
+        self.resources = resources  # available (LUT, FF, DSP)
+
+    def mul_dsps(self, ls, rs):  # number of DSP slices for signed ls x rs bit product
+        (a, b) = self.dsp
+        if ls < rs:
+            ls, rs = rs, ls
+        return ((ls + a - 2) // (a - 1)) * ((rs + b - 2) // (b - 1))
+
+    def cost(self, op, role=None):  # (delay, LUT, DSP) of operator (sizes annotated by evaluation), role in DSP
+        c = opclass.get(op.opc)
+        if c is None:   # load, shift by constant
+            return 0.0, 0, 0
+        if role == "pre" or role == "post":
+            return self.table[role + "add"][0], 0, 0
+        (d, dw, lw) = self.table[c]
+        if c == "mul":
+            n = self.mul_dsps(op.left.size, op.right.size)
+            return d + dw*(n-1), int(lw*op.size*(n-1)), n
+        if c == "logic":
+            return d, 1, 0
+        w = op.size
+        if c == "cmp":
+            w = max(op.left.size, op.right.size)
+        return d + dw*w, int(lw*w + 0.5), 0
+
+    def op_delay(self, op, role=None):
+        return self.cost(op, role)[0]
+
+    def expr_delay(self, op, roles=None):  # delay of expression tree (critical path of operators), roles: {op: DSP role}
+        t = 0.0
+        for x in [op.left, op.right]:
+            if isinstance(x, Op):
+                t = max(t, self.expr_delay(x, roles))
+        if roles:
+            return t + self.op_delay(op, roles.get(op))
+        return t + self.op_delay(op)
+
+    def mux(self, size):  # (delay, LUT) of conditional register assignment
+        (d, dw, lw) = self.table["mux"]
+        return d, int(lw*size + 0.5)
+
+    def dsp_luts(self):  # LUTs worth one DSP slice (LUT/DSP ratio of device), area weight of multipliers
+        return float(self.resources[0]) / self.resources[2]
+
+    def ff_luts(self):  # LUTs worth one register bit (LUT/FF ratio of device), area weight of pipeline stages
+        return float(self.resources[0]) / self.resources[1]
+
+    def fmax(self, delay):  # estimated maximum clock frequency (MHz) of stage delay (ns)
+        return 1000.0 / (delay + self.register)
+
+
+# Zynq-7010 (xc7z010-1, Red Pitaya): 17600 LUT, 35200 FF, 80 DSP48E1
+devices = {"xc7z010": Device("xc7z010", {"add": (0.6, 0.03, 1.0), "cmp": (0.6, 0.03, 1.0), "logic": (0.6, 0.0, 1.0),
+                                         "mul": (3.4, 1.8, 1.0), "mux": (0.4, 0.0, 1.0),
+                                         "preadd": (1.4, 0.0, 0.0), "postadd": (1.2, 0.0, 0.0)},
+                             (25, 18), 0.6, (17600, 35200, 80))}
+default_device = "xc7z010"
+
+
+def device(name=None):  # Device of name (default device for None)
+    name = name or default_device
+    if name not in devices:
+        raise SynthError("Timing: unknown device " + name + ", known: " + ", ".join(sorted(devices)))
+    return devices[name]
+
+
+class Path(object):  # timing path to register (stage) or comb block output
+    __slots__ = ('name', 'delay', 'steps')
+
+    def __init__(self, name, delay, steps):
+        self.name = name        # stage n or comb block name
+        self.delay = delay      # path delay (ns)
+        self.steps = steps      # [(statement, operator delay, arrival)] from path start
+
+    def ops(self):  # operators on path
+        s = []
+        for (st, d, t) in self.steps:
+            op = st.oplist[0]
+            if op.opc != Opc.load:
+                s.append(op.op)
+        return " ".join(s)
+
+
+def statement_path(st, dev, arrival, roles, extra=0.0):  # (delay, steps) of assignment with operand arrivals
+    t = 0.0
+    steps = []
+    vs = []
+    op = st.oplist[0]
+    for x in [op.left, op.right]:
+        if isinstance(x, Op):
+            vs += [y for y in [x.left, x.right] if isinstance(y, Var)]
+        elif isinstance(x, Var):
+            vs.append(x)
+    for v in vs:
+        if v in arrival and arrival[v][0] > t:
+            t, steps = arrival[v]
+    d = dev.expr_delay(op, roles) + extra
+    return t + d, steps + [(st, d, t + d)]
+
+
+def clocked_assignments(body, stlist, cond):  # append (assign, conditional) of clocked block body
+    for st in body.stlist:
+        if isinstance(st, Assign):
+            stlist.append((st, cond))
+        elif isinstance(st, IfElse):
+            clocked_assignments(st.body, stlist, True)
+            if st.elsbody is not None:
+                clocked_assignments(st.elsbody, stlist, True)
+    return stlist
+
+
+def static_timing(t, dev):  # paths and resources of Transf t after build_wrapper: ([Path], (LUT, FF, DSP))
+    fn = t.myp.body.stlist[0]   # MyHDL proc function: signals, comb blocks, clocked block
+    arrival = {}                # comb target -> (delay, steps)
+    roles = t.dsp               # operators mapped to DSP slices
+    paths = []
+    stages = {}                 # stage -> worst path of clocked blocks (main and DSP groups)
+    luts = ffs = dsps = 0
+    for blk in fn.body.stlist:
+        if not isinstance(blk, Function):
+            continue
+        if blk.decorator == "@always_comb":     # blocks in tree level order: operands first
+            worst = None
+            for st in blk.body.stlist:
+                arrival[st.target] = statement_path(st, dev, arrival, roles)
+                (d, l, n) = dev.cost(st.oplist[0], roles.get(st.oplist[0]))
+                luts += l
+                dsps += n
+                if worst is None or arrival[st.target][0] > worst[0]:
+                    worst = arrival[st.target]
+            if worst is not None:
+                paths.append(Path(blk.name, worst[0], worst[1]))
+        else:
+            regs = set()
+            muxed = set()
+            for (st, cond) in clocked_assignments(blk.body, [], False):
+                extra = 0.0
+                if cond:
+                    (extra, l) = dev.mux(st.target.size)
+                    if st.target not in muxed:  # one multiplexer per register
+                        muxed.add(st.target)
+                        luts += l
+                p = statement_path(st, dev, arrival, roles, extra)
+                (d, l, n) = dev.cost(st.oplist[0], roles.get(st.oplist[0]))
+                luts += l
+                dsps += n
+                if st.target not in regs:
+                    regs.add(st.target)
+                    ffs += max(st.target.size, 1)
+                s = st.target.reglevel
+                if s not in stages or p[0] > stages[s][0]:
+                    stages[s] = p
+    for s in sorted(stages):
+        paths.append(Path("stage " + str(s), stages[s][0], stages[s][1]))
+    return paths, (luts, ffs, dsps)
+
+
+def write_report(f, paths, res, dev, period=None):  # static timing and resource report to file-like f
+    print ("Static timing (" + dev.name + ", estimate):", file=f)
+    print ("  %-10s %9s %9s  %s" % ("path", "delay ns", "slack ns", "operators"), file=f)
+    worst = None
+    for p in paths:
+        slack = "-"
+        if period:
+            slack = "%9.3f" % (period - dev.register - p.delay)
+        print ("  %-10s %9.3f %9s  %s" % (p.name, p.delay, slack, p.ops()), file=f)
+        if worst is None or p.delay > worst.delay:
+            worst = p
+    if worst is not None:
+        print ("Critical path: " + worst.name + ", %.3f ns, estimated Fmax: %.1f MHz" % (
+            worst.delay, dev.fmax(worst.delay)), file=f)
+        for (st, d, t) in worst.steps:
+            print ("  %7.3f %7.3f  %s" % (d, t, st.code(0).strip()), file=f)
+    (luts, ffs, dsps) = res
+    (al, af, ad) = dev.resources
+    print ("Resources (estimate): LUT %d (%.1f%%), FF %d (%.1f%%), DSP %d (%.1f%%)" % (
+        luts, 100.0*luts/al, ffs, 100.0*ffs/af, dsps, 100.0*dsps/ad), file=f)
+    return worst
@@ -0,0 +1,155 @@
+# -------------------------------------------------------------------------------
+# verilog.py
+#
+# Verilog backend for pipeline synthesis tool: writes the MyHDL wrapper program
+# built by Transf.build_wrapper() directly as a Verilog module proc with the
+# toVerilog port list, no MyHDL conversion needed
+#   @always_comb blocks      -> continuous assignments
+#   @always(clk.posedge)     -> always @(posedge clk) with nonblocking assignments
+#   Signal sizes (signed)    -> signed [size-1:0], size <= 1: 1-bit
+#   DSP mapped operators     -> (* use_dsp = "yes" *) on their targets (Transf.map_dsp)
+#
+# Copyright (C) 2017, Andrej Trost
+# License: MIT
+# -------------------------------------------------------------------------------
+from pyprog import Signal, Num, Bool, Op, Opc, Assign, IfElse, Function, tab
+
+vops = {Opc.add: '+', Opc.sub: '-', Opc.mul: '*', Opc.shr: '>>>', Opc.shl: '<<<', Opc.eq: '==', Opc.ne: '!=',
+        Opc.ge: '>=', Opc.le: '<=', Opc.gt: '>', Opc.lt: '<', Opc.land: '&&', Opc.lor: '||'}
+arith = (Opc.add, Opc.sub, Opc.mul, Opc.shr, Opc.shl)
+compare = (Opc.eq, Opc.ne, Opc.ge, Opc.le, Opc.gt, Opc.lt)
+logic = compare + (Opc.land, Opc.lor, Opc.lnot)     # 1-bit (unsigned) results
+
+
+def vtype(v):  # signed range of variable or "" for 1-bit
+    if v.size <= 1:
+        return ""
+    return "signed [" + str(v.size-1) + ":0] "
+
+
+def write_operand(f, x, signed):  # write operand, signed: 1-bit operands are extended to signed
+    # an unsigned operand makes the whole Verilog expression unsigned
+    if isinstance(x, Op):
+        if signed and x.opc in logic:
+            f.write("$signed({1'b0, ")
+            write_expr(f, x)
+            f.write("})")
+        else:
+            f.write("(")
+            write_expr(f, x)
+            f.write(")")
+    elif isinstance(x, Bool):
+        if signed:
+            f.write(str(x.value))   # integer constant is signed
+        else:
+            f.write("1'b" + str(x.value))
+    elif isinstance(x, Num):
+        if x.size > 32 and x.value < 0:
+            f.write("-" + str(x.size) + "'sd" + str(-x.value))
+        elif x.size > 32:
+            f.write(str(x.size) + "'sd" + str(x.value))
+        else:
+            f.write(str(x.value))
+    elif signed and x.size <= 1:
+        f.write("$signed({1'b0, " + x.name + "})")
+    else:
+        f.write(x.name)
+
+
+def write_expr(f, op):  # write expression tree
+    if op.opc == Opc.load:
+        write_operand(f, op.left, False)
+    elif op.opc == Opc.lnot:
+        f.write("!")
+        write_operand(f, op.right, False)
+    else:
+        signed = op.opc in arith or op.opc in compare
+        write_operand(f, op.left, signed)
+        f.write(" " + vops[op.opc] + " ")
+        write_operand(f, op.right, signed and op.opc != Opc.shr and op.opc != Opc.shl)
+
+
+def write_body(f, body, level):  # clocked block statements
+    for st in body.stlist:
+        if isinstance(st, Assign):
+            f.write(tab(level) + st.target.name + " <= ")
+            write_expr(f, st.oplist[0])
+            f.write(";\n")
+        elif isinstance(st, IfElse):
+            f.write(tab(level) + "if (")
+            write_expr(f, st.cond.oplist[0])
+            f.write(") begin\n")
+            write_body(f, st.body, level+1)
+            if st.elsbody is not None:
+                f.write(tab(level) + "end\n" + tab(level) + "else begin\n")
+                write_body(f, st.elsbody, level+1)
+            f.write(tab(level) + "end\n")
+
+
+def body_targets(body, targets):  # add assignment targets of body (and if statements) to targets
+    for st in body.stlist:
+        if isinstance(st, Assign):
+            targets.add(st.target)
+        elif isinstance(st, IfElse):
+            body_targets(st.body, targets)
+            if st.elsbody is not None:
+                body_targets(st.elsbody, targets)
+    return targets
+
+
+def write_verilog(t, f, name="proc"):  # write Verilog module of Transf t (after build_wrapper) to file-like f
+    fn = t.myp.body.stlist[0]   # MyHDL proc function: signals, comb blocks, clocked block
+    comb = []
+    clocked = []
+    for st in fn.body.stlist:
+        if isinstance(st, Function):
+            if st.decorator == "@always_comb":
+                comb.append(st)
+            else:
+                clocked.append(st)
+    regs = set()
+    for blk in clocked:
+        body_targets(blk.body, regs)
+    dsp = set()     # targets of operators mapped to DSP slices (unconditional)
+    for blk in comb + clocked:
+        for st in blk.body.stlist:
+            if isinstance(st, Assign) and st.oplist[0] in t.dsp:
+                dsp.add(st.target)
+
+    ports = [v for v in fn.vardict.values() if v.mode == Signal.inport]  # toVerilog port order
+    ports += [v for v in fn.vardict.values() if v.mode == Signal.outport]
+    f.write("// Generated by PyPipeSynth\n\n`timescale 1ns/10ps\n\nmodule " + name + " (\n")
+    decl = []
+    for v in ports:
+        if v.mode == Signal.inport:
+            decl.append(tab(1) + "input " + vtype(v) + v.name)
+        elif v in regs:
+            decl.append(tab(1) + "output reg " + vtype(v) + v.name)
+        else:
+            decl.append(tab(1) + "output " + vtype(v) + v.name)
+    f.write(",\n".join(decl) + "\n);\n\n")
+
+    for v in fn.vardict.values():  # internal signals
+        if v.mode == Signal.int:
+            if v in dsp:
+                f.write('(* use_dsp = "yes" *) ')
+            if v in regs:
+                f.write("reg " + vtype(v) + v.name + " = 0;\n")
+            else:
+                f.write("wire " + vtype(v) + v.name + ";\n")
+    f.write("\n")
+
+    for blk in comb:
+        for st in blk.body.stlist:
+            f.write("assign " + st.target.name + " = ")
+            write_expr(f, st.oplist[0])
+            f.write(";\n")
+
+    for blk in clocked:
+        f.write("\n")
+        if blk.name in t.dsp_blocks:    # registers of DSP multiply-add group
+            f.write("// DSP48 " + blk.name + ": " + t.dsp_blocks[blk.name] + "\n")
+        f.write("always @(posedge clk) begin: " + name.upper() + "_" + blk.name.upper() + "\n")
+        write_body(f, blk.body, 1)
+        f.write("end\n")
+    f.write("\nendmodule\n")
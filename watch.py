@@ -0,0 +1,129 @@
+# -------------------------------------------------------------------------------
+# watch.py
+#
+# Watch mode for pipeline synthesis tool: poll function, ini and template files
+# and resynthesize only what a change affects
+#   function source: only changed top-level functions are parsed again,
+#                    proc.py, proc.v are rebuilt if the synthesized (first) function changed
+#   ini:             parsed program is reused, transform and interface run again
+#   template:        only the interface is generated again
+#
+# Copyright (C) 2017, Andrej Trost
+# License: MIT
+# -------------------------------------------------------------------------------
+from __future__ import print_function
+import ast
+import os
+import time
+from pyprog import Writer, SynthError
+from astpar import AstPar
+from config import Conf
+from interface import Interface
+from cache import text_key
+from PyPipeSynth import synthesize, clock_conf, read_text, write_text
+
+clock = getattr(time, "perf_counter", time.time)
+
+
+def split_functions(src):  # return [(name, first line, text)] of top-level functions in source
+    lines = src.splitlines(True)
+    nodes = ast.parse(src).body
+    funcs = []
+    for i in range(len(nodes)):
+        node = nodes[i]
+        if not isinstance(node, ast.FunctionDef):
+            continue
+        end = len(lines)
+        if i+1 < len(nodes):    # next statement, decorators of next function start before its def line
+            nxt = nodes[i+1]
+            end = min([nxt.lineno] + [d.lineno for d in getattr(nxt, "decorator_list", [])]) - 1
+        funcs.append((node.name, node.lineno, "".join(lines[node.lineno-1:end])))
+    return funcs
+
+
+class Watcher:
+
+    def __init__(self, src, ini, template, paths, log=None, clock=None):
+        self.files = {"src": src, "ini": ini, "template": template}
+        self.paths = paths      # artifact name -> output file
+        self.log = log          # file-like for messages (None: stdout)
+        self.clock = clock      # target clock (MHz) replacing the ini clock (--clock)
+        self.mtimes = {}
+        self.funcs = {}         # function name -> (source hash, parsed program)
+        self.keys = {}          # artifact name -> hash of its inputs at last write
+        self.texts = {}
+
+    def changed(self):  # return True if a watched file changed since last call
+        ch = False
+        for (name, fname) in self.files.items():
+            try:
+                st = os.stat(fname)
+                m = (st.st_mtime, st.st_size)
+            except OSError:  # being replaced by editor
+                continue
+            if self.mtimes.get(name) != m:
+                self.mtimes[name] = m
+                ch = True
+        return ch
+
+    def parse(self, src, log):  # parse changed functions, return name of first function
+        first = None
+        names = set()
+        for (name, line, text) in split_functions(src):
+            h = text_key(text)
+            names.add(name)
+            if name not in self.funcs or self.funcs[name][0] != h:
+                t0 = clock()
+                # leading newlines keep error line numbers of the file
+                p = AstPar(log).parse("\n"*(line-1) + text, name)
+                self.funcs[name] = (h, p)
+                print ("Parse %s: %.1f ms" % (name, 1e3*(clock()-t0)), file=self.log)
+            if first is None:
+                first = name
+        for name in list(self.funcs):   # forget deleted functions
+            if name not in names:
+                del self.funcs[name]
+        return first
+
+    def update(self):  # resynthesize outputs affected by changed files, return list of written files
+        t0 = clock()
+        for name in self.files:
+            self.texts[name] = read_text(self.files[name])
+        log = Writer()  # synthesis messages
+        try:
+            first = self.parse(self.texts["src"], log)
+            if first is None:
+                print ("No function in " + self.files["src"], file=self.log)
+                return []
+            ini = self.texts["ini"]
+            keys = {"proc.py": text_key(self.funcs[first][0], ini), "proc.v": text_key(self.funcs[first][0], ini),
+                    "red_pitaya_proc.v": text_key(ini, self.texts["template"])}
+            todo = [name for name in keys if keys[name] != self.keys.get(name)]
+            if "proc.py" in todo:   # transform (proc.py, proc.v and interface) from parsed program
+                out = synthesize(self.funcs[first][1], clock_conf(ini, self.clock, log), self.texts["template"], first, log)
+            elif todo:
+                out = {"red_pitaya_proc.v": Interface(Conf(text=ini, log=log), log).compile(self.texts["template"])}
+        except SynthError as e:
+            print ("Error: " + str(e) + ", waiting for changes", file=self.log)
+            return []
+        written = []
+        for name in todo:
+            write_text(self.paths[name], out[name])
+            self.keys[name] = keys[name]
+            written.append(self.paths[name])
+        if written:
+            print ("Updated %s in %.1f ms" % (", ".join(written), 1e3*(clock()-t0)), file=self.log)
+        return written
+
+    def run(self, interval=0.05):  # poll files until interrupted
+        print ("Watching " + ", ".join(sorted(self.files.values())) + " (Ctrl-C to stop)", file=self.log)
+        try:
+            while True:
+                if self.changed():
+                    try:
+                        self.update()
+                    except Exception as e:  # file in the middle of editing: keep watching
+                        print ("Error: %s: %s, waiting for changes" % (e.__class__.__name__, e), file=self.log)
+                time.sleep(interval)
+        except KeyboardInterrupt:
+            pass